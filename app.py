@@ -15,22 +15,55 @@ This file is identical to your uploaded app.py except:
 - Kept all other code and routes unchanged.
 """
 
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Blueprint, Flask, Response, g, request, send_from_directory
 from flask_cors import CORS
+from flask.json.provider import JSONProvider
 from pathlib import Path
 from services.prices import make_default_market, Stock
-from trading import Portfolio
-import datetime
-import shutil
+from trading import (
+    Portfolio,
+    PORTFOLIO_FILE as PORTFOLIO_STORE,
+    PORTFOLIO_JSON_FILE,
+    TRADES_FILE,
+)
+import atexit
+import collections
+import functools
+import itertools
+import hashlib
+import json
+import math
+import os
+import queue
+import sys
+import threading
+import types
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 BASE_DIR = Path(__file__).resolve().parent
 STATIC_DIR = BASE_DIR / "static"
 DATA_DIR = BASE_DIR / "data"
-PORTFOLIO_FILE = DATA_DIR / "portfolio.json"
 
-app = Flask(__name__, static_folder=str(STATIC_DIR))
+# Plain-string copies for per-request use (avoids building Path objects).
+STATIC_DIR_STR = str(STATIC_DIR)
+INDEX_PATH_STR = str(STATIC_DIR / "index.html")
+PORTFOLIO_STORE_STR = str(PORTFOLIO_STORE)
+TRADES_FILE_STR = str(TRADES_FILE)
+
+app = Flask(__name__, static_folder=STATIC_DIR_STR)
+# Let browsers cache static assets and revalidate with conditional GETs (304s).
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 3600
+# Behind a front server that honours X-Sendfile (Apache mod_xsendfile,
+# lighttpd), let it send static files instead of streaming them through Python.
+# Off by default: the dev server would answer with empty bodies.
+app.use_x_sendfile = os.environ.get("USE_X_SENDFILE", "0") == "1"
 CORS(app)
 
 # -----------------------
@@ -43,25 +76,42 @@ LOG_FILE = LOG_DIR / "server.log"
 logger = logging.getLogger("stock_app")
 logger.setLevel(logging.INFO)
 
-handler = RotatingFileHandler(
-    filename=str(LOG_FILE),
-    maxBytes=3_000_000,
-    backupCount=3
-)
-formatter = logging.Formatter("%(asctime)s  %(levelname)s  %(message)s")
-handler.setFormatter(formatter)
-
 if not logger.handlers:
-    logger.addHandler(handler)
+    # built only when the logger is first configured (not on re-imports)
+    from logging.handlers import RotatingFileHandler
+
+    handler = RotatingFileHandler(
+        filename=str(LOG_FILE),
+        maxBytes=3_000_000,
+        backupCount=3,
+        delay=True,
+    )
+    formatter = logging.Formatter("%(asctime)s  %(levelname)s  %(message)s")
+    handler.setFormatter(formatter)
+
+    # Request threads only enqueue records; a single listener thread owns the
+    # rotating file handler, so disk writes and rotation stay off the request path.
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    log_listener = QueueListener(log_queue, handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+
+def _has_body():
+    """True when the request carries a body worth reading (skips GET/HEAD)."""
+    return request.method in ("POST", "PUT", "PATCH") and (request.content_length or 0) > 0
 
 
 @app.before_request
 def log_request():
-    try:
-        body = request.get_data(as_text=True)
-    except Exception:
-        body = ""
-    logger.info(f"REQ {request.remote_addr} {request.method} {request.path} body={body}")
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    # Bodies are not read or logged here; Content-Length comes from the headers.
+    logger.info(
+        "REQ %s %s %s len=%s",
+        request.remote_addr, request.method, request.path, request.content_length or 0,
+    )
 
 
 # -----------------------
@@ -70,6 +120,126 @@ def log_request():
 # Move market here so helpers that reference `market` are safe at runtime.
 market = make_default_market()
 
+# Writers (next/addstock/reset) mutate `market` under _MARKET_LOCK and then
+# publish an immutable snapshot; readers use MARKET_SNAPSHOT without locking.
+# The version is bumped on every publish so read endpoints can reuse
+# previously serialized payloads. prices is a read-only view of price_dict,
+# the plain dict handed to the JSON encoder (callers must not mutate it).
+MarketSnapshot = collections.namedtuple(
+    "MarketSnapshot", "version date prices symbols price_vector price_dict"
+)
+
+_MARKET_LOCK = threading.Lock()
+# format -> (snapshot version, serialized /api/prices or /api/prices_live body, etag)
+_PRICES_CACHE = {}
+MARKET_SNAPSHOT = None
+
+
+def _publish_market_snapshot():
+    """Swap in a fresh read-only {symbol: price} view (sorted by symbol)."""
+    global MARKET_SNAPSHOT
+    version = MARKET_SNAPSHOT.version + 1 if MARKET_SNAPSHOT is not None else 0
+    symbols, price_vector = market.price_vector()
+    prices = dict(zip(symbols, price_vector.tolist()))
+    MARKET_SNAPSHOT = MarketSnapshot(
+        version,
+        str(market.date),
+        types.MappingProxyType(prices),
+        symbols,
+        price_vector,
+        prices,
+    )
+
+
+_publish_market_snapshot()
+
+
+# -----------------------
+# JSON encoding
+# -----------------------
+# orjson writes bytes in one pass and handles dates/numpy floats natively;
+# fall back to stdlib json when it is not installed.
+# The encoder and the Response constructor are pre-bound with functools.partial
+# so the per-request helpers don't pay an extra Python call frame.
+if orjson is not None:
+    _DUMPS = orjson.dumps
+    _DUMPS_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
+    loads_json = orjson.loads
+    dumps_json = functools.partial(_DUMPS, option=_DUMPS_OPTS)
+else:
+    _DUMPS = json.dumps
+    loads_json = json.loads
+
+    def _json_default(obj):
+        # numpy arrays/scalars expose tolist(); everything else (dates) -> str
+        if hasattr(obj, "tolist"):
+            return obj.tolist()
+        return str(obj)
+
+    def dumps_json(obj):
+        # compact like orjson, so spliced envelopes keep one style
+        return _DUMPS(obj, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+_json_response = functools.partial(Response, mimetype="application/json")
+
+
+def _envelope_prefix(fields):
+    """Encode a constant envelope once, left open so fields can be spliced in."""
+    return dumps_json(fields)[:-1] + b","
+
+
+def _splice_json(prefix, fields):
+    """Close an envelope prefix with freshly encoded (key bytes, value) pairs."""
+    return prefix + b",".join(b'"' + k + b'":' + dumps_json(v) for k, v in fields) + b"}"
+
+
+def _etag_for(body):
+    """Short content hash of a response body, used as its ETag."""
+    return hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def _conditional_json(body, etag=None):
+    """
+    Return body as JSON with an ETag, or an empty 304 Not Modified when the
+    client's If-None-Match already names that ETag.
+    """
+    if etag is None:
+        etag = _etag_for(body)
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = _json_response(body, status=200)
+    resp.set_etag(etag)
+    return resp
+
+
+# constant envelopes of the ticker endpoints; only date/prices vary per snapshot
+_PRICES_PREFIX = _envelope_prefix({"success": True, "message": "prices returned"})
+_PRICES_LIVE_PREFIX = _envelope_prefix({
+    "success": True,
+    "message": "Live data disabled; running in simulation mode.",
+    "live_enabled": False,
+})
+
+
+if orjson is not None:
+    class OrjsonProvider(JSONProvider):
+        """Flask JSON provider backed by orjson (used by jsonify/get_json)."""
+
+        def dumps(self, obj, **kwargs):
+            return _DUMPS(obj, option=_DUMPS_OPTS | orjson.OPT_NON_STR_KEYS).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    # orjson output is already compact and keeps insertion order
+    app.json = OrjsonProvider(app)
+else:
+    # Compact, unsorted JSON even in debug mode. Flask 2.2 deprecates the
+    # JSONIFY_PRETTYPRINT_REGULAR / JSON_SORT_KEYS config keys in favour of these.
+    app.json.compact = True
+    app.json.sort_keys = False
+
 
 # -----------------------
 # Helper functions
@@ -87,7 +257,7 @@ def resp_ok(message="ok", data=None, status=200):
     payload = {"success": True, "message": message}
     if isinstance(data, dict):
         payload.update(data)
-    return jsonify(payload), status
+    return _json_response(dumps_json(payload), status=status)
 
 
 def resp_err(message="error", status=400, data=None):
@@ -103,61 +273,276 @@ def resp_err(message="error", status=400, data=None):
     payload = {"success": False, "error": message}
     if isinstance(data, dict):
         payload.update(data)
-    return jsonify(payload), status
+    return _json_response(dumps_json(payload), status=status)
 
 
 def read_json_request(require_json=False):
-    try:
-        j = request.get_json(silent=True)
-    except Exception:
-        j = None
+    j = None
+    if _has_body() and request.is_json:
+        try:
+            j = loads_json(request.get_data(cache=False))
+        except Exception:
+            j = None
     if require_json and j is None:
         return None, resp_err("Request body must be valid JSON", 400)
     return j or {}, None
 
 
+# -----------------------
+# Input validation
+# -----------------------
+# Each spec entry: (key, type, default, min, max). min/max may be None.
+TRADE_SPEC = (
+    ("symbol", str, None, None, None),
+    ("qty", int, None, 1, 10**9),
+)
+ADDSTOCK_SPEC = (
+    ("symbol", str, None, None, None),
+    ("price", float, None, None, None),
+    ("mu", float, 0.0005, None, None),
+    ("sigma", float, 0.02, None, None),
+)
+NEXT_SPEC = (
+    ("days", int, 1, 1, 3650),
+)
+
+_TYPE_NAMES = {int: "an integer", float: "a number", str: "a string"}
+
+
+def _sym(s):
+    """
+    Uppercase an ASCII ticker symbol. Symbols from the UI are usually already
+    uppercase and are returned as-is without allocating. Returns None for
+    non-ASCII symbols (no Unicode case-mapping). The result is interned, so
+    dict lookups against market/holdings keys compare by identity.
+    """
+    if not s.isascii():
+        return None
+    return sys.intern(s if s.isupper() else s.upper())
+
+
+def _coerce_value(value, typ):
+    """Convert value to typ, returning None instead of raising when it can't."""
+    if typ is str:
+        return value.strip() if isinstance(value, str) else None
+    if typ is int:
+        if isinstance(value, int):
+            # int() turns bools into 1/0 like the old int(j.get(...)) parsing
+            return int(value)
+        if isinstance(value, float):
+            return int(value) if math.isfinite(value) else None
+    elif typ is float:
+        if isinstance(value, (int, float)):
+            return float(value)
+    if isinstance(value, str):
+        if typ is int and value.isascii() and value.isdigit():
+            # plain digit strings parse straight to int, no float round-trip
+            return int(value)
+        # numeric-ish strings ("5.0", " 5") are still accepted
+        try:
+            num = float(value)
+        except ValueError:
+            return None
+        if typ is float:
+            return num
+        return int(num) if math.isfinite(num) else None
+    return None
+
+
+def _coerce(j, spec):
+    """
+    Validate and convert the fields of j described by spec.
+    Returns (values_dict, None) or (None, error_response).
+    """
+    out = {}
+    for key, typ, default, lo, hi in spec:
+        raw = j.get(key, default)
+        if raw is None:
+            return None, resp_err(f"{key} is required", 400)
+        value = _coerce_value(raw, typ)
+        if value is None:
+            return None, resp_err(f"{key} must be {_TYPE_NAMES[typ]}", 400)
+        if typ is str and not value:
+            return None, resp_err(f"{key} is required", 400)
+        if lo is not None and value < lo:
+            return None, resp_err(f"{key} must be >= {lo}", 400)
+        if hi is not None and value > hi:
+            return None, resp_err(f"{key} too large (max {hi})", 400)
+        out[key] = value
+    return out, None
+
+
 def ensure_data_dir():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def _prices_dict():
-    """Return simple { symbol: price } mapping from market.stocks."""
+def _copy_file_fast(src, dst):
+    """
+    Copy src to dst inside the kernel with os.copy_file_range (reflink on
+    btrfs/xfs), falling back to shutil.copyfile. Metadata is copied like copy2.
+    """
+    import shutil  # only needed on the rare reset-backup path
+
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    except (AttributeError, OSError):
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+# -----------------------
+# Portfolio cache
+# -----------------------
+# Portfolio.load() re-reads and re-parses the snapshot file; keep the last result
+# and reuse it while the file's (mtime_ns, size) is unchanged.
+_PORT_CACHE = {"key": None, "val": None}
+_PORT_LOCK = threading.Lock()
+
+
+def _portfolio_file_key():
+    # trades.jsonl is appended between snapshot rewrites, so another process's
+    # journaled trades change the key even when the snapshot has not
     try:
-        return {sym: float(stock.price) for sym, stock in getattr(market, "stocks", {}).items()}
-    except Exception:
-        return {}
+        st = os.stat(PORTFOLIO_STORE_STR)
+    except OSError:
+        return None
+    try:
+        jt = os.stat(TRADES_FILE_STR)
+    except OSError:
+        journal = None
+    else:
+        journal = (jt.st_mtime_ns, jt.st_size)
+    return (st.st_mtime_ns, st.st_size, journal)
+
+
+def _load_portfolio_cached():
+    """Return the cached Portfolio, reloading only when the snapshot file changed."""
+    with _PORT_LOCK:
+        key = _portfolio_file_key()
+        if key is not None and _PORT_CACHE["key"] == key:
+            return _PORT_CACHE["val"]
+        portfolio = Portfolio.load()
+        _PORT_CACHE["key"] = _portfolio_file_key()
+        _PORT_CACHE["val"] = portfolio
+        return portfolio
+
+
+def _invalidate_portfolio_cache():
+    with _PORT_LOCK:
+        _PORT_CACHE["key"] = None
+        # every trade is already journaled; the next load replays it
+        _PORT_CACHE["val"] = None
+
 
+def _store_portfolio_cache(portfolio):
+    """Adopt a just-written portfolio as the cached value for the new files."""
+    with _PORT_LOCK:
+        _PORT_CACHE["key"] = _portfolio_file_key()
+        _PORT_CACHE["val"] = portfolio
 
-def _portfolio_summary_dict(portfolio):
+
+def get_portfolio():
+    """Return this request's Portfolio, loading it (via the cache) at most once."""
+    portfolio = g.get("portfolio")
+    if portfolio is None:
+        portfolio = _load_portfolio_cached()
+        g.portfolio = portfolio
+    return portfolio
+
+
+# The cached Portfolio is shared by every request: hold this lock while
+# reading it or across validate + mutate + persist, so concurrent trades
+# cannot interleave their updates to cash, holdings and the trade log.
+_PORTFOLIO_LOCK = threading.RLock()
+
+
+def _flush_portfolio():
+    """Write the snapshot for trades still only in trades.jsonl at shutdown."""
+    with _PORTFOLIO_LOCK:
+        portfolio = _PORT_CACHE["val"]
+        if portfolio is not None:
+            portfolio.flush()
+
+
+atexit.register(_flush_portfolio)
+
+
+def _holdings_columns(holdings_map, snap):
     """
-    Build a JSON-serializable portfolio summary dict:
-    { cash, net_worth, holdings: [ {symbol, qty, price, value}, ... ] }
+    Price holdings from the market snapshot snap as parallel lists:
+    (symbols, qtys, prices, values). Unknown symbols get price/value None.
+    Holdings symbols are already uppercase (Portfolio keeps them that way).
     """
-    cash = getattr(portfolio, "cash", 0.0)
-    # build holdings list similar to api_portfolio
-    holdings_map = getattr(portfolio, "holdings", {}) or {}
-    holdings = []
+    snapshot_prices = snap.prices
+    syms, qtys, prices, values = [], [], [], []
     for sym, qty in holdings_map.items():
         try:
             qty_num = int(qty)
         except Exception:
             continue
-        stock = getattr(market, "stocks", {}).get(sym.upper())
-        price = float(stock.price) if stock is not None else None
-        value = (price * qty_num) if (price is not None) else None
-        holdings.append({"symbol": sym, "qty": qty_num, "price": price, "value": value})
+        price = snapshot_prices.get(sym)
+        syms.append(sym)
+        qtys.append(qty_num)
+        prices.append(price)
+        values.append((price * qty_num) if (price is not None) else None)
+    return syms, qtys, prices, values
+
+
+def _holdings_rows(syms, qtys, prices, values):
+    """Turn holdings columns into [ {symbol, qty, price, value}, ... ]."""
+    return [
+        {"symbol": sym, "qty": qty, "price": price, "value": value}
+        for sym, qty, price, value in zip(syms, qtys, prices, values)
+    ]
 
-    try:
-        net_worth = portfolio.net_worth(market)
-    except Exception:
-        # fallback: approximate from cash + holdings with known prices
-        approx = float(cash or 0.0)
-        for h in holdings:
-            if h["value"] is not None:
-                approx += float(h["value"])
-        net_worth = approx
 
-    return {"cash": cash, "net_worth": net_worth, "holdings": holdings}
+def _net_worth(cash, values):
+    """Net worth from _holdings_columns values: cash + holdings with known prices."""
+    approx = float(cash or 0.0)
+    for value in values:
+        if value is not None:
+            approx += float(value)
+    return approx
+
+
+def _trade_response(portfolio, snap, symbol, qty, price):
+    """
+    Build the canonical /api/buy and /api/sell fields: symbol, qty, price,
+    cash, net_worth, trades, prices and portfolio_summary
+    { cash, net_worth, holdings: [ {symbol, qty, price, value}, ... ] }.
+
+    Holdings are priced from snap and net worth is summed in the same pass,
+    so holdings are walked once per trade.
+    """
+    cash = portfolio.cash
+    snapshot_prices = snap.prices
+    net_worth = float(cash or 0.0)
+    holdings = []
+    # Portfolio keeps holdings as uppercase symbol -> positive int
+    for sym, held in portfolio.holdings.items():
+        sym_price = snapshot_prices.get(sym)
+        value = None
+        if sym_price is not None:
+            value = sym_price * held
+            net_worth += value
+        holdings.append({"symbol": sym, "qty": held, "price": sym_price, "value": value})
+
+    return {
+        "symbol": symbol,
+        "qty": qty,
+        "price": price,
+        "cash": cash,
+        "net_worth": net_worth,
+        "trades": portfolio.trade_history,
+        "prices": snap.price_dict,
+        "portfolio_summary": {"cash": cash, "net_worth": net_worth, "holdings": holdings},
+    }
 
 
 # -----------------------
@@ -165,94 +550,145 @@ def _portfolio_summary_dict(portfolio):
 # -----------------------
 @app.route("/", methods=["GET"])
 def root():
-    index_path = STATIC_DIR / "index.html"
-    if index_path.exists():
-        return send_from_directory(str(STATIC_DIR), "index.html")
+    if os.path.isfile(INDEX_PATH_STR):
+        return send_from_directory(STATIC_DIR_STR, "index.html", conditional=True)
     return resp_ok(
         "Stock Simulator API running. Visit /api/prices",
         {"routes": ["/api/prices", "/api/portfolio"]}
     )
 
 
-@app.route("/static/<path:filename>", methods=["GET"])
-def static_files(filename):
-    file_path = STATIC_DIR / filename
-    if file_path.exists():
-        return send_from_directory(str(STATIC_DIR), filename)
-    return resp_err("Not found", 404)
+# /static/<path> is served by Flask's built-in static route (static_folder);
+# missing files raise NotFound -> handle_404.
 
 
 # -----------------------
 # API endpoints
 # -----------------------
-@app.route("/api/prices", methods=["GET"])
+api_bp = Blueprint("api", __name__, url_prefix="/api")
+
+
+@api_bp.route("/prices", methods=["GET"])
 def api_prices():
+    """
+    Returns: { message, date, prices: {symbol: price} }
+    With ?format=columnar: { message, date, symbols: [...], prices: [...] }
+    """
     try:
-        stocks = market.list_prices()
-        return resp_ok(
-            "prices returned",
-            {"date": str(market.date), "prices": stocks}
-        )
+        snap = MARKET_SNAPSHOT
+        fmt = "columnar" if request.args.get("format") == "columnar" else "default"
+        cached = _PRICES_CACHE.get(fmt)
+        if cached is None or cached[0] != snap.version:
+            if fmt == "columnar":
+                fields = ((b"date", snap.date), (b"symbols", snap.symbols),
+                          (b"prices", snap.price_vector))
+            else:
+                fields = ((b"date", snap.date), (b"prices", snap.price_dict))
+            body = _splice_json(_PRICES_PREFIX, fields)
+            cached = (snap.version, body, _etag_for(body))
+            _PRICES_CACHE[fmt] = cached
+        return _conditional_json(cached[1], cached[2])
     except Exception as e:
         logger.exception("Failed to list prices")
         return resp_err(f"Failed to list prices: {e}", 500)
 
 
-@app.route("/api/next", methods=["POST"])
+# Background /api/next runs: one worker so simulations apply in submit order.
+_SIM_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="simulate")
+_SIM_JOB_IDS = itertools.count(1)
+_SIM_JOB = None  # (job_id, days, future) of the latest background run
+
+
+def _run_simulation(days):
+    """Advance the market by days and publish the new snapshot; returns its date."""
+    with _MARKET_LOCK:
+        market.simulate_days(days)
+        _publish_market_snapshot()
+    snap = MARKET_SNAPSHOT
+    logger.info("SIMULATE days=%s new_date=%s", days, snap.date)
+    return snap.date
+
+
+@api_bp.route("/next", methods=["POST"])
 def api_next():
+    """
+    Advance the simulation. Runs inline by default; with {"background": true}
+    (or ?background=1) it is queued and answered with 202 and a job_id to
+    poll at /api/next/status.
+    """
+    global _SIM_JOB
     j, err = read_json_request(require_json=False)
     if err:
         return err
 
-    days = j.get("days", request.args.get("days", 1))
-    try:
-        days = int(days)
-    except Exception:
-        return resp_err("days must be an integer", 400)
-    if days < 1:
-        return resp_err("days must be >= 1", 400)
-    if days > 3650:
-        return resp_err("days too large (max 3650)", 400)
+    data, err = _coerce({"days": j.get("days", request.args.get("days", 1))}, NEXT_SPEC)
+    if err:
+        return err
+    days = data["days"]
 
     try:
-        market.simulate_days(days)
-        logger.info(f"SIMULATE days={days} new_date={market.date}")
+        if j.get("background") is True or request.args.get("background") == "1":
+            job_id = next(_SIM_JOB_IDS)
+            _SIM_JOB = (job_id, days, _SIM_EXECUTOR.submit(_run_simulation, days))
+            return resp_ok(
+                f"Advancing {days} day(s) in the background",
+                {"job_id": job_id, "days": days},
+                202,
+            )
+
+        date = _run_simulation(days)
         return resp_ok(
             f"Advanced {days} day(s)",
-            {"date": str(market.date)}
+            {"date": date}
         )
     except Exception as e:
         logger.exception("Simulation failed")
         return resp_err(f"Simulation failed: {e}", 500)
 
 
-@app.route("/api/addstock", methods=["POST"])
+@api_bp.route("/next/status", methods=["GET"])
+def api_next_status():
+    """
+    Returns: { message, job_id, days, done, date } for the latest background
+    /api/next run (date is null until it finishes).
+    """
+    job = _SIM_JOB
+    if job is None:
+        return resp_ok("no background simulation", {"job_id": None, "done": True})
+    job_id, days, future = job
+    if not future.done():
+        return resp_ok("running", {"job_id": job_id, "days": days, "done": False, "date": None})
+    exc = future.exception()
+    if exc is not None:
+        return resp_err(f"Simulation failed: {exc}", 500, {"job_id": job_id, "days": days})
+    return resp_ok(
+        f"Advanced {days} day(s)",
+        {"job_id": job_id, "days": days, "done": True, "date": future.result()},
+    )
+
+
+@api_bp.route("/addstock", methods=["POST"])
 def api_addstock():
     j, err = read_json_request(require_json=True)
     if err:
         return err
 
-    symbol = (j.get("symbol") or "").strip().upper()
-    if not symbol:
-        return resp_err("symbol is required", 400)
-    if symbol in market.stocks:
-        return resp_err("stock already exists", 400)
-
-    try:
-        price = float(j.get("price"))
-    except Exception:
-        return resp_err("price must be a number", 400)
-
-    try:
-        mu = float(j.get("mu", 0.0005))
-        sigma = float(j.get("sigma", 0.02))
-    except Exception:
-        return resp_err("mu and sigma must be numbers", 400)
+    data, err = _coerce(j, ADDSTOCK_SPEC)
+    if err:
+        return err
+    symbol = _sym(data["symbol"])
+    if symbol is None:
+        return resp_err("symbol must be ASCII", 400)
+    price, mu, sigma = data["price"], data["mu"], data["sigma"]
 
     try:
-        stock = Stock(symbol, price, mu, sigma)
-        market.add_stock(stock)
-        logger.info(f"ADDSTOCK {symbol} price={price} mu={mu} sigma={sigma}")
+        with _MARKET_LOCK:
+            if symbol in market.stocks:
+                return resp_err("stock already exists", 400)
+            stock = Stock(symbol, price, mu, sigma)
+            market.add_stock(stock)
+            _publish_market_snapshot()
+        logger.info("ADDSTOCK %s price=%s mu=%s sigma=%s", symbol, price, mu, sigma)
         return resp_ok(
             "stock added",
             {"symbol": symbol, "price": price, "mu": mu, "sigma": sigma},
@@ -266,7 +702,7 @@ def api_addstock():
 # -----------------------
 # Replaced broken /buy with canonical /api/buy
 # -----------------------
-@app.route("/api/buy", methods=["POST"])
+@api_bp.route("/buy", methods=["POST"])
 def api_buy():
     """
     Expects JSON: { "symbol": "ABC", "qty": 1 }
@@ -276,51 +712,36 @@ def api_buy():
     if err:
         return err
 
-    symbol = (j.get("symbol") or "").strip().upper()
-    qty = j.get("qty", None)
-
-    if not symbol:
-        return resp_err("symbol is required", 400)
-
-    try:
-        qty = int(float(qty))  # accept numeric-ish values but convert to int
-    except Exception:
-        return resp_err("qty must be an integer", 400)
-    if qty <= 0:
-        return resp_err("qty must be > 0", 400)
-
-    if symbol not in market.stocks:
+    data, err = _coerce(j, TRADE_SPEC)
+    if err:
+        return err
+    symbol = _sym(data["symbol"])
+    if symbol is None:
+        return resp_err("symbol must be ASCII", 400)
+    qty = data["qty"]
+
+    # Use current market price (from one consistent snapshot) as executed price
+    snap = MARKET_SNAPSHOT
+    price = snap.prices.get(symbol)
+    if price is None:
         return resp_err("unknown symbol", 400)
 
     try:
-        # Load portfolio (Portfolio.load handles default case)
-        portfolio = Portfolio.load()
+        with _PORTFOLIO_LOCK:
+            # Load portfolio (Portfolio.load handles default case)
+            portfolio = get_portfolio()
 
-        # Use current market price as executed price
-        price = float(market.stocks[symbol].price)
-
-        # portfolio.buy mutates and saves internally; it raises on failure.
-        portfolio.buy(symbol, price, qty, market.date)
-
-        # After calling buy(), the portfolio is persisted by trading.Portfolio.save()
-        # Prepare canonical response
-        trades = getattr(portfolio, "trade_history", []) or []
-        prices = _prices_dict()
-        portfolio_summary = _portfolio_summary_dict(portfolio)
-
-        response = {
-            "symbol": symbol,
-            "qty": qty,
-            "price": price,
-            "cash": getattr(portfolio, "cash", None),
-            "net_worth": portfolio_summary.get("net_worth"),
-            "trades": trades,
-            "prices": prices,
-            "portfolio_summary": portfolio_summary,
-        }
+            # portfolio.buy journals the trade (the snapshot is rewritten in
+            # batches, see FLUSH_EVERY) and raises on failure; re-key the
+            # cache for the grown trades.jsonl instead of re-reading it.
+            portfolio.buy(symbol, price, qty, snap.date)
+            _store_portfolio_cache(portfolio)
+
+            response = _trade_response(portfolio, snap, symbol, qty, price)
         return resp_ok("bought", response, 200)
 
     except Exception as e:
+        _invalidate_portfolio_cache()
         logger.exception("Buy failed")
         # return JSON-safe error payload
         return resp_err(f"Buy failed: {e}", 500, {"trades": [], "prices": {}})
@@ -329,7 +750,7 @@ def api_buy():
 # -----------------------
 # Update /api/sell to persist and return canonical fields
 # -----------------------
-@app.route("/api/sell", methods=["POST"])
+@api_bp.route("/sell", methods=["POST"])
 def api_sell():
     """
     Expects JSON: { "symbol": "ABC", "qty": 1 }
@@ -339,123 +760,87 @@ def api_sell():
     if err:
         return err
 
-    symbol = (j.get("symbol") or "").strip().upper()
-    qty = j.get("qty", None)
-
-    if not symbol:
-        return resp_err("symbol is required", 400)
+    data, err = _coerce(j, TRADE_SPEC)
+    if err:
+        return err
+    symbol = _sym(data["symbol"])
+    if symbol is None:
+        return resp_err("symbol must be ASCII", 400)
+    qty = data["qty"]
+
+    # Use current market price (from one consistent snapshot) as executed price
+    snap = MARKET_SNAPSHOT
+    price = snap.prices.get(symbol)
+    if price is None:
+        return resp_err("unknown symbol", 400)
 
     try:
-        qty = int(float(qty))
-    except Exception:
-        return resp_err("qty must be an integer", 400)
-    if qty <= 0:
-        return resp_err("qty must be > 0", 400)
+        with _PORTFOLIO_LOCK:
+            portfolio = get_portfolio()
 
-    if symbol not in market.stocks:
-        return resp_err("unknown symbol", 400)
+            # journaled like buy; will raise on insufficient shares
+            portfolio.sell(symbol, price, qty, snap.date)
+            _store_portfolio_cache(portfolio)
 
-    try:
-        portfolio = Portfolio.load()
-        price = float(market.stocks[symbol].price)
-
-        # portfolio.sell mutates + saves internally; will raise on insufficient shares
-        portfolio.sell(symbol, price, qty, market.date)
-
-        trades = getattr(portfolio, "trade_history", []) or []
-        prices = _prices_dict()
-        portfolio_summary = _portfolio_summary_dict(portfolio)
-
-        response = {
-            "symbol": symbol,
-            "qty": qty,
-            "price": price,
-            "cash": getattr(portfolio, "cash", None),
-            "net_worth": portfolio_summary.get("net_worth"),
-            "trades": trades,
-            "prices": prices,
-            "portfolio_summary": portfolio_summary,
-        }
+            response = _trade_response(portfolio, snap, symbol, qty, price)
         return resp_ok("sold", response, 200)
 
     except Exception as e:
+        _invalidate_portfolio_cache()
         logger.exception("Sell failed")
         return resp_err(f"Sell failed: {e}", 400, {"trades": [], "prices": {}})
 
 
-@app.route("/api/portfolio", methods=["GET"])
+@api_bp.route("/portfolio", methods=["GET"])
 def api_portfolio():
     """
-    - Works whether Portfolio.load() returns a dict or an object.
     - Returns: { message, cash, net_worth, holdings: [...] }
+    - With ?format=columnar, returns parallel lists instead of holdings:
+      { message, cash, net_worth, symbols, qtys, prices, values }
     """
     try:
-        portfolio = Portfolio.load()
-
-        if isinstance(portfolio, dict):
-            cash = portfolio.get("cash", 0.0)
-            holdings_map = portfolio.get("holdings", {}) or {}
+        # holdings and net worth are both priced from this one snapshot
+        snap = MARKET_SNAPSHOT
+        with _PORTFOLIO_LOCK:
+            portfolio = get_portfolio()
+            # get_portfolio() always hands back a Portfolio
+            cash = portfolio.cash
+            syms, qtys, prices, values = _holdings_columns(portfolio.holdings, snap)
+        net_worth = _net_worth(cash, values)
+
+        payload = {"success": True, "message": "portfolio", "cash": cash, "net_worth": net_worth}
+        if request.args.get("format") == "columnar":
+            payload["symbols"] = syms
+            payload["qtys"] = qtys
+            payload["prices"] = prices
+            payload["values"] = values
         else:
-            cash = getattr(portfolio, "cash", 0.0)
-            holdings_map = getattr(portfolio, "holdings", {}) or {}
-
-        holdings = []
-        for sym, qty in holdings_map.items():
-            try:
-                qty_num = int(qty)
-            except Exception:
-                continue
-
-            stock = market.stocks.get(sym)
-            price = stock.price if stock is not None else None
-            value = (price * qty_num) if (price is not None) else None
-
-            holdings.append(
-                {"symbol": sym, "qty": qty_num, "price": price, "value": value}
-            )
-
-        net_worth = None
-        if isinstance(portfolio, dict):
-            net_worth = portfolio.get("net_worth")
-        else:
-            try:
-                net_worth = portfolio.net_worth(market)
-            except Exception:
-                net_worth = None
-
-        if net_worth is None:
-            approx = float(cash or 0.0)
-            for h in holdings:
-                if h["value"] is not None:
-                    approx += float(h["value"])
-            net_worth = approx
-
-        return resp_ok(
-            "portfolio",
-            {"cash": cash, "net_worth": net_worth, "holdings": holdings},
-        )
+            payload["holdings"] = _holdings_rows(syms, qtys, prices, values)
+        # pollers re-sending the ETag get a 304 until a trade or /api/next
+        return _conditional_json(dumps_json(payload))
     except Exception as e:
         logger.exception("Failed to load portfolio")
         return resp_err(f"Failed to load portfolio: {e}", 500)
 
 
-@app.route("/api/history", methods=["GET"])
+@api_bp.route("/history", methods=["GET"])
 def api_history():
     """
     Returns: { message, trades: [...] }
     """
     try:
-        portfolio = Portfolio.load()
-        if isinstance(portfolio, dict):
-            trades = portfolio.get("trade_history") or portfolio.get("trades") or []
-        else:
-            trades = (
-                getattr(portfolio, "trade_history", None)
-                or getattr(portfolio, "trades", [])
-                or []
-            )
-        if trades is None:
-            trades = []
+        with _PORTFOLIO_LOCK:
+            portfolio = get_portfolio()
+            if isinstance(portfolio, dict):
+                trades = portfolio.get("trade_history") or portfolio.get("trades") or []
+            else:
+                trades = (
+                    getattr(portfolio, "trade_history", None)
+                    or getattr(portfolio, "trades", [])
+                    or []
+                )
+            if trades is None:
+                trades = []
 
         return resp_ok("history", {"trades": trades})
     except Exception as e:
@@ -463,7 +848,7 @@ def api_history():
         return resp_err(f"Failed to load history: {e}", 500)
 
 
-@app.route("/api/stats", methods=["GET"])
+@api_bp.route("/stats", methods=["GET"])
 def api_stats():
     """
     Returns summary statistics based on trade_history:
@@ -475,32 +860,17 @@ def api_stats():
     Matches frontend loadStats() expectations.
     """
     try:
-        portfolio = Portfolio.load()
-        trades = getattr(portfolio, "trade_history", []) or []
-
-        total_buys = 0.0
-        total_sells = 0.0
+        snap = MARKET_SNAPSHOT
+        with _PORTFOLIO_LOCK:
+            portfolio = get_portfolio()
 
-        for t in trades:
-            try:
-                t_type = str(t.get("type", "")).upper()
-                qty = int(t.get("qty", 0))
-                price = float(t.get("price", 0.0))
-            except Exception:
-                continue
+            total_buys, total_sells = portfolio.trade_totals()
 
-            if qty <= 0 or price < 0:
-                continue
-
-            amount = price * qty
-            if t_type == "BUY":
-                total_buys += amount
-            elif t_type == "SELL":
-                total_sells += amount
-
-        net_invested = total_buys - total_sells
-        total_profit = portfolio.net_worth(market) - 10000.0
-        num_trades = len(trades)
+            net_invested = total_buys - total_sells
+            # priced from the snapshot, like /api/portfolio
+            values = _holdings_columns(portfolio.holdings, snap)[3]
+            total_profit = _net_worth(portfolio.cash, values) - 10000.0
+            num_trades = len(portfolio.trade_log)
 
         return resp_ok(
             "stats",
@@ -517,45 +887,72 @@ def api_stats():
         return resp_err(f"Failed to compute stats: {e}", 500)
 
 
-@app.route("/api/price_history/<string:symbol>", methods=["GET"])
+@api_bp.route("/price_history/<string:symbol>", methods=["GET"])
 def api_price_history(symbol):
     """
     Returns: { message, symbol, dates: [...], prices: [...] }
     Which matches JS: data.dates, data.prices
     """
-    symbol = symbol.upper()
-    if symbol not in market.stocks:
-        return resp_err("unknown symbol", 404)
-
-    stock = market.stocks[symbol]
-    history_list = list(stock.history)
-
-    dates = [str(d) for d, _ in history_list]
-    prices = [float(p) for _, p in history_list]
-
-    return resp_ok(
-        "price history",
-        {"symbol": symbol, "dates": dates, "prices": prices},
-    )
-
-
-@app.route("/api/reset", methods=["POST"])
+    # a background /api/next may be appending to the history ring buffer;
+    # read it under the lock so head and data come from the same state
+    with _MARKET_LOCK:
+        stock = market.stocks.get(_sym(symbol))
+        if stock is None:
+            return resp_err("unknown symbol", 404)
+        symbol = stock.symbol
+        # The JSON encoder emits dates as YYYY-MM-DD itself, so the columns are
+        # handed over as-is and encoded straight into the response body.
+        dates, prices = stock.history_columns()
+    body = dumps_json({
+        "success": True,
+        "message": "price history",
+        "symbol": symbol,
+        "dates": dates,
+        "prices": prices,
+    })
+    return _json_response(body, status=200, direct_passthrough=True)
+
+
+@api_bp.route("/reset", methods=["POST"])
 def api_reset():
     try:
-        ensure_data_dir()
-        backup_name = None
-        if PORTFOLIO_FILE.exists():
-            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_name = DATA_DIR / f"portfolio_backup_{ts}.json"
-            shutil.copy2(PORTFOLIO_FILE, backup_name)
+        with _PORTFOLIO_LOCK:
+            ensure_data_dir()
+            backup_name = None
+            import datetime  # only needed to stamp the backup names
 
-        default_port = Portfolio()
-        default_port.save()
+            ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            stem = f"portfolio_backup_{ts}"
+            # The snapshot, a not-yet-migrated portfolio.json and the trade log
+            # all belong to the portfolio being replaced; each is backed up on
+            # its own, since save() below truncates trades.jsonl.
+            for src, suffix in (
+                (PORTFOLIO_STORE, PORTFOLIO_STORE.suffix),
+                (PORTFOLIO_JSON_FILE, ".json"),
+                (TRADES_FILE, ".trades.jsonl"),
+            ):
+                if not src.exists():
+                    continue
+                dst = src.parent / (stem + suffix)
+                # the file is about to be replaced, so move it aside
+                # (metadata-only) instead of copying its bytes
+                try:
+                    os.rename(src, dst)
+                except OSError:
+                    _copy_file_fast(src, dst)
+                if backup_name is None:
+                    backup_name = dst
+
+            default_port = Portfolio()
+            default_port.save()
+            _invalidate_portfolio_cache()
 
         global market
-        market = make_default_market()
+        with _MARKET_LOCK:
+            market = make_default_market()
+            _publish_market_snapshot()
 
-        logger.info(f"RESET performed; backup={backup_name}")
+        logger.info("RESET performed; backup=%s", backup_name)
         return resp_ok(
             "reset complete",
             {"backup": str(backup_name) if backup_name else None},
@@ -565,7 +962,7 @@ def api_reset():
         return resp_err(f"Reset failed: {e}", 500)
 
 
-@app.route("/api/login", methods=["POST"])
+@api_bp.route("/login", methods=["POST"])
 def api_login():
     """
     Lightweight login endpoint.
@@ -593,7 +990,7 @@ def api_login():
         logger.exception("Login failed")
         return resp_err(f"Login failed: {e}", 500)
 
-@app.route("/api/prices_live", methods=["GET"])
+@api_bp.route("/prices_live", methods=["GET"])
 def api_prices_live():
     """
     Live prices endpoint - simplified safe mode.
@@ -601,36 +998,47 @@ def api_prices_live():
     can continue rendering the ticker without error and knows live mode is disabled.
     """
     try:
-        simulated_prices = market.list_prices()
-        data = {
-            "live_enabled": False,              # explicitly tell the UI live mode is disabled
-            "message": "Live data disabled; running in simulation mode.",
-            "date": str(market.date),
-            "prices": simulated_prices
-        }
+        snap = MARKET_SNAPSHOT
+        cached = _PRICES_CACHE.get("live")
+        if cached is None or cached[0] != snap.version:
+            # envelope (incl. live_enabled: false) is pre-encoded; splice the prices in
+            fields = ((b"date", snap.date), (b"prices", snap.price_dict))
+            body = _splice_json(_PRICES_LIVE_PREFIX, fields)
+            cached = (snap.version, body, _etag_for(body))
+            _PRICES_CACHE["live"] = cached
         # Return HTTP 200 so the frontend does not treat this as a service failure.
-        return resp_ok("live disabled", data, 200)
+        return _conditional_json(cached[1], cached[2])
     except Exception as e:
         logger.exception("prices_live failed")
         return resp_err(f"prices_live failed: {e}", 500)
 
 
+app.register_blueprint(api_bp)
+
+
 # -----------------------
 # Generic error handlers
 # -----------------------
+# Bodies are constant, so serialize them once at import time.
+_404_BODY = dumps_json({"success": False, "error": "Not found"})
+_500_BODY = dumps_json({"success": False, "error": "Server error"})
+
+
 @app.errorhandler(404)
 def handle_404(e):
-    return resp_err("Not found", 404)
+    return _json_response(_404_BODY, status=404)
 
 
 @app.errorhandler(500)
 def handle_500(e):
-    return resp_err("Server error", 500)
+    return _json_response(_500_BODY, status=500)
 
 
 # -----------------------
 # Run server
 # -----------------------
 if __name__ == "__main__":
+    # Debug mode (reloader, pretty tracebacks) only when FLASK_DEBUG=1.
+    debug = os.environ.get("FLASK_DEBUG", "0") == "1"
     print("Starting app on http://127.0.0.1:5001")
-    app.run(host="127.0.0.1", port=5001, debug=True)
+    app.run(host="127.0.0.1", port=5001, debug=debug)
@@ -3,30 +3,60 @@
 # Usage: python fix_portfolios.py
 
 import pathlib, json, shutil
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
 DATA_DIR = pathlib.Path(r"C:\simple_stock_simulator.project\data")
 
-files = sorted(DATA_DIR.glob("portfolio_*.json"))
-print(f"Found {len(files)} portfolio files in {DATA_DIR}")
+if orjson is not None:
+    loads = orjson.loads
+
+    def dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+else:
+    loads = json.loads
+
+    def dumps(data):
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
 
-for p in files:
+
+def fix_one(p):
+    """Back up and rewrite one portfolio file; returns the lines to report."""
+    log = []
     try:
         # backup first
         bak = p.with_suffix(p.suffix + ".bak")
         shutil.copy2(p, bak)
-        print(f"  backed up {p.name} -> {bak.name}")
+        log.append(f"  backed up {p.name} -> {bak.name}")
 
-        # read with utf-8-sig (handles BOM)
-        s = p.read_text(encoding="utf-8-sig")
-        data = json.loads(s) if s.strip() else {}
+        # parse the raw bytes; strip a UTF-8 BOM without decoding to str
+        raw = p.read_bytes().removeprefix(b"\xef\xbb\xbf")
+        data = loads(raw) if raw.strip() else {}
 
         # ensure initial_cash exists and is numeric
         if "initial_cash" not in data or not isinstance(data.get("initial_cash"), (int, float)):
             data["initial_cash"] = 10000.0
 
         # write back as utf-8 without BOM
-        p.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
-        print(f"  rewrote {p.name} (initial_cash={data['initial_cash']})")
+        p.write_bytes(dumps(data))
+        log.append(f"  rewrote {p.name} (initial_cash={data['initial_cash']})")
     except Exception as e:
-        print(f"  failed {p.name}: {e}")
+        log.append(f"  failed {p.name}: {e}")
+    return log
+
+
+files = sorted(DATA_DIR.glob("portfolio_*.json"))
+print(f"Found {len(files)} portfolio files in {DATA_DIR}")
+
+# the work is disk latency, not CPU, so overlap the per-file I/O;
+# output is printed afterwards in file order
+with ThreadPoolExecutor(max_workers=16) as ex:
+    for lines in ex.map(fix_one, files):
+        for line in lines:
+            print(line)
 
 print("Done.")
@@ -10,13 +10,24 @@ Run with:
     python main.py
 """
 
+import atexit
+import datetime
+import sys
+
 from services.prices import make_default_market
-from trading import Portfolio
+from trading import Portfolio, TYPE_NAMES
 
 try:
-    import matplotlib.pyplot as plt
-except Exception:
-    plt = None
+    import readline  # noqa: F401  (line editing and history for input())
+except ImportError:  # not available on Windows
+    pass
+
+# matplotlib is imported on the first pricehist, not at startup
+_plt = None
+_plt_tried = False
+
+# date.toordinal() of 1970-01-01, the datetime64 epoch
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
 
 COMMANDS = '''
 Available commands:
@@ -36,10 +47,235 @@ Available commands:
 '''
 
 
+# ---- command handlers: each takes (parts, market, portfolio) ----
+def _cmd_help(parts, market, portfolio):
+    print(COMMANDS)
+
+
+def _write_lines(lines):
+    """Write many output lines with a single stdout write."""
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+
+
+def _cmd_prices(parts, market, portfolio):
+    prices = market.list_prices()
+    _write_lines([f"{s}: {p:.2f}" for s, p in prices.items()])
+
+
+def _cmd_config(parts, market, portfolio):
+    lines = [f"Simulated date: {market.date}", 'Stocks:']
+    for sym, st in market.stocks.items():
+        # defensive: history may be empty
+        try:
+            _, hist_prices = st.history_arrays()
+            first_price = hist_prices[0] if len(hist_prices) > 0 else st.price
+            lines.append(
+                f"  {sym} start ~ {first_price:.2f} "
+                f"current {st.price:.2f} mu={st.mu} sigma={st.sigma}"
+            )
+        except Exception:
+            lines.append(f"  {sym} current {st.price:.2f} mu={st.mu} sigma={st.sigma}")
+    _write_lines(lines)
+
+
+def _cmd_addstock(parts, market, portfolio):
+    # Usage: addstock SYMBOL PRICE [mu] [sigma]
+    if len(parts) < 3:
+        print('Usage: addstock SYMBOL PRICE [mu] [sigma]')
+        return
+
+    sym = sys.intern(parts[1].upper())
+    try:
+        price = float(parts[2])
+    except ValueError:
+        print('PRICE must be a number, e.g. 12.5')
+        return
+
+    try:
+        mu = float(parts[3]) if len(parts) > 3 else 0.0005
+        sigma = float(parts[4]) if len(parts) > 4 else 0.02
+    except ValueError:
+        print('mu and sigma must be numbers')
+        return
+
+    # create and add the stock to the market
+    from services.prices import Stock
+    if sym in market.stocks:
+        print(f'Stock {sym} already exists.')
+        return
+
+    stock = Stock(sym, price, mu, sigma)
+    market.add_stock(stock)
+    print(f'Added stock {sym} @ {price:.2f} mu={mu} sigma={sigma}')
+
+
+def _cmd_next(parts, market, portfolio):
+    try:
+        n = int(parts[1]) if len(parts) > 1 else 1
+        if n < 1:
+            print('Number of days must be >= 1')
+            return
+    except Exception:
+        print("Usage: next N  (N must be a positive integer)")
+        return
+
+    market.simulate_days(n)
+    print(f"Advanced {n} day(s). New date: {market.date}")
+
+
+def _cmd_buy(parts, market, portfolio):
+    if len(parts) < 3:
+        print('Usage: buy SYMBOL QTY')
+        return
+
+    sym = sys.intern(parts[1].upper())
+
+    try:
+        qty = int(parts[2])
+        if qty <= 0:
+            print('Quantity must be a positive integer')
+            return
+    except ValueError:
+        print('Usage: buy SYMBOL QTY  (QTY must be an integer)')
+        return
+
+    if sym not in market.stocks:
+        print('Unknown symbol')
+        return
+
+    price = market.stocks[sym].price
+    try:
+        portfolio.buy(sym, price, qty, market.date)
+        print(f"Bought {qty} of {sym} @ {price:.2f} -> cash {portfolio.cash:.2f}")
+    except Exception as e:
+        # friendly error from Portfolio (e.g. insufficient cash)
+        print(f"Buy failed: {e}")
+
+
+def _cmd_sell(parts, market, portfolio):
+    if len(parts) < 3:
+        print('Usage: sell SYMBOL QTY')
+        return
+
+    sym = sys.intern(parts[1].upper())
+
+    try:
+        qty = int(parts[2])
+        if qty <= 0:
+            print('Quantity must be a positive integer')
+            return
+    except ValueError:
+        print('Usage: sell SYMBOL QTY  (QTY must be an integer)')
+        return
+
+    if sym not in market.stocks:
+        print('Unknown symbol')
+        return
+
+    price = market.stocks[sym].price
+    try:
+        portfolio.sell(sym, price, qty, market.date)
+        print(f"Sold {qty} of {sym} @ {price:.2f} -> cash {portfolio.cash:.2f}")
+    except Exception as e:
+        print(f"Sell failed: {e}")
+
+
+def _cmd_portfolio(parts, market, portfolio):
+    try:
+        print(portfolio.summary(market))
+    except Exception as e:
+        print(f"Could not show portfolio summary: {e}")
+
+
+def _cmd_history(parts, market, portfolio):
+    log = portfolio.trade_log
+    if not len(log):
+        print('No trades yet.')
+        return
+    # the log only holds well-formed trades
+    lines = [
+        f"{t.date} {TYPE_NAMES[t.type]} {t.symbol} {t.qty} @ {t.price:.2f}"
+        for t in log.rows()
+    ]
+    _write_lines(lines)
+
+
+def _pyplot():
+    """Import matplotlib.pyplot once, on demand; None when unavailable."""
+    global _plt, _plt_tried
+    if not _plt_tried:
+        _plt_tried = True
+        try:
+            import matplotlib.pyplot as _plt
+        except Exception:
+            _plt = None
+    return _plt
+
+
+def _cmd_pricehist(parts, market, portfolio):
+    if len(parts) < 2:
+        print('Usage: pricehist SYMBOL')
+        return
+
+    sym = sys.intern(parts[1].upper())
+    if sym not in market.stocks:
+        print('Unknown symbol')
+        return
+
+    plt = _pyplot()
+    if plt is None:
+        print('matplotlib not available. Install matplotlib:')
+        print('  pip install matplotlib')
+        return
+
+    stock = market.stocks[sym]
+    # plot straight from the history arrays; date ordinals become
+    # datetime64 days in one vectorized step
+    date_ords, prices = stock.history_arrays()
+    dates = (date_ords - _EPOCH_ORDINAL).astype('datetime64[D]')
+
+    if not len(dates) or not len(prices):
+        print('No price history available to plot.')
+        return
+
+    try:
+        plt.figure()
+        plt.plot(dates, prices)
+        plt.title(f"Price history: {sym}")
+        plt.xlabel('Date')
+        plt.ylabel('Price')
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+        plt.show()
+    except Exception as e:
+        print(f"Plot failed: {e}")
+
+
+# action -> handler, looked up once per command (quit/exit are handled in main)
+DISPATCH = {
+    'help': _cmd_help,
+    'h': _cmd_help,
+    '?': _cmd_help,
+    'prices': _cmd_prices,
+    'list': _cmd_prices,
+    'config': _cmd_config,
+    'addstock': _cmd_addstock,
+    'next': _cmd_next,
+    'buy': _cmd_buy,
+    'sell': _cmd_sell,
+    'portfolio': _cmd_portfolio,
+    'history': _cmd_history,
+    'pricehist': _cmd_pricehist,
+}
+
+
 def main():
     print('Simple stock market simulator (CLI)')
     market = make_default_market()
     portfolio = Portfolio.load()
+    # trades are saved in batches; write out whatever is pending on exit
+    atexit.register(portfolio.flush)
 
     print("Type 'help' to see commands.\n")
 
@@ -56,201 +292,17 @@ def main():
         parts = cmd.split()
         action = parts[0].lower()
 
-        try:
-            # ---- EXIT / HELP ----
-            if action in ('quit', 'exit'):
-                print('Goodbye!')
-                break
-
-            elif action in ('help', 'h', '?'):
-                print(COMMANDS)
-
-            # ---- PRICES ----
-            elif action in ('prices', 'list'):
-                prices = market.list_prices()
-                for s, p in prices.items():
-                    print(f"{s}: {p:.2f}")
-
-            # ---- CONFIG ----
-            elif action == 'config':
-                print(f"Simulated date: {market.date}")
-                print('Stocks:')
-                for sym, st in market.stocks.items():
-                    # defensive: history may be empty
-                    try:
-                        first_price = st.history[0][1] if len(st.history) > 0 else st.price
-                        print(
-                            f"  {sym} start ~ {first_price:.2f} "
-                            f"current {st.price:.2f} mu={st.mu} sigma={st.sigma}"
-                        )
-                    except Exception:
-                        print(f"  {sym} current {st.price:.2f} mu={st.mu} sigma={st.sigma}")
-
-            # ---- ADD STOCK ----
-            elif action == 'addstock':
-                # Usage: addstock SYMBOL PRICE [mu] [sigma]
-                if len(parts) < 3:
-                    print('Usage: addstock SYMBOL PRICE [mu] [sigma]')
-                    continue
-
-                sym = parts[1].upper()
-                try:
-                    price = float(parts[2])
-                except ValueError:
-                    print('PRICE must be a number, e.g. 12.5')
-                    continue
-
-                try:
-                    mu = float(parts[3]) if len(parts) > 3 else 0.0005
-                    sigma = float(parts[4]) if len(parts) > 4 else 0.02
-                except ValueError:
-                    print('mu and sigma must be numbers')
-                    continue
-
-                # create and add the stock to the market
-                from services.prices import Stock
-                if sym in market.stocks:
-                    print(f'Stock {sym} already exists.')
-                    continue
-
-                stock = Stock(sym, price, mu, sigma)
-                market.add_stock(stock)
-                print(f'Added stock {sym} @ {price:.2f} mu={mu} sigma={sigma}')
-
-            # ---- SIMULATE DAYS ----
-            elif action == 'next':
-                try:
-                    n = int(parts[1]) if len(parts) > 1 else 1
-                    if n < 1:
-                        print('Number of days must be >= 1')
-                        continue
-                except Exception:
-                    print("Usage: next N  (N must be a positive integer)")
-                    continue
-
-                market.simulate_days(n)
-                print(f"Advanced {n} day(s). New date: {market.date}")
-
-            # ---- BUY ----
-            elif action == 'buy':
-                if len(parts) < 3:
-                    print('Usage: buy SYMBOL QTY')
-                    continue
-
-                sym = parts[1].upper()
-
-                try:
-                    qty = int(parts[2])
-                    if qty <= 0:
-                        print('Quantity must be a positive integer')
-                        continue
-                except ValueError:
-                    print('Usage: buy SYMBOL QTY  (QTY must be an integer)')
-                    continue
-
-                if sym not in market.stocks:
-                    print('Unknown symbol')
-                    continue
-
-                price = market.stocks[sym].price
-                try:
-                    portfolio.buy(sym, price, qty, market.date)
-                    print(f"Bought {qty} of {sym} @ {price:.2f} -> cash {portfolio.cash:.2f}")
-                except Exception as e:
-                    # friendly error from Portfolio (e.g. insufficient cash)
-                    print(f"Buy failed: {e}")
-
-            # ---- SELL ----
-            elif action == 'sell':
-                if len(parts) < 3:
-                    print('Usage: sell SYMBOL QTY')
-                    continue
-
-                sym = parts[1].upper()
-
-                try:
-                    qty = int(parts[2])
-                    if qty <= 0:
-                        print('Quantity must be a positive integer')
-                        continue
-                except ValueError:
-                    print('Usage: sell SYMBOL QTY  (QTY must be an integer)')
-                    continue
-
-                if sym not in market.stocks:
-                    print('Unknown symbol')
-                    continue
-
-                price = market.stocks[sym].price
-                try:
-                    portfolio.sell(sym, price, qty, market.date)
-                    print(f"Sold {qty} of {sym} @ {price:.2f} -> cash {portfolio.cash:.2f}")
-                except Exception as e:
-                    print(f"Sell failed: {e}")
-
-            # ---- PORTFOLIO ----
-            elif action == 'portfolio':
-                try:
-                    print(portfolio.summary(market))
-                except Exception as e:
-                    print(f"Could not show portfolio summary: {e}")
-
-            # ---- HISTORY ----
-            elif action == 'history':
-                if not getattr(portfolio, "trade_history", None):
-                    print('No trades yet.')
-                else:
-                    for t in portfolio.trade_history:
-                        # defensive formatting
-                        try:
-                            print(
-                                f"{t.get('date','')} {t.get('type','')} "
-                                f"{t.get('symbol','')} {t.get('qty','')} "
-                                f"@ {float(t.get('price',0)):.2f}"
-                            )
-                        except Exception:
-                            print(t)
-
-            # ---- PRICE HISTORY PLOT ----
-            elif action == 'pricehist':
-                if len(parts) < 2:
-                    print('Usage: pricehist SYMBOL')
-                    continue
-
-                sym = parts[1].upper()
-                if sym not in market.stocks:
-                    print('Unknown symbol')
-                    continue
-
-                if plt is None:
-                    print('matplotlib not available. Install matplotlib:')
-                    print('  pip install matplotlib')
-                    continue
-
-                stock = market.stocks[sym]
-                dates = [str(d) for d, _ in stock.history]
-                prices = [p for _, p in stock.history]
-
-                if not dates or not prices:
-                    print('No price history available to plot.')
-                    continue
-
-                try:
-                    plt.figure()
-                    plt.plot(dates, prices)
-                    plt.title(f"Price history: {sym}")
-                    plt.xlabel('Date')
-                    plt.ylabel('Price')
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
-                    plt.show()
-                except Exception as e:
-                    print(f"Plot failed: {e}")
-
-            # ---- UNKNOWN COMMAND ----
-            else:
-                print("Unknown command. Type 'help' to see available commands.")
+        if action in ('quit', 'exit'):
+            print('Goodbye!')
+            break
+
+        handler = DISPATCH.get(action)
+        if handler is None:
+            print("Unknown command. Type 'help' to see available commands.")
+            continue
 
+        try:
+            handler(parts, market, portfolio)
         except Exception as e:
             print(f"Error: {e}")
 
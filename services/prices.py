@@ -1,9 +1,73 @@
 # services/prices.py
 import math
-import random
+import sys
 import datetime
-from collections import deque
-from typing import Deque, Dict, Tuple, Optional
+from typing import Dict, Iterable, List, Tuple, Optional
+
+import numpy as np
+
+# shared generator for the vectorized simulation in Market.simulate_days
+_RNG = np.random.default_rng()
+
+
+class _GaussBuffer:
+    """Hands out standard normals one at a time from pre-sampled NumPy batches."""
+
+    def __init__(self, rng: np.random.Generator, batch: int = 1024):
+        self._rng = rng
+        self._batch = batch
+        self._buf: List[float] = []
+        self._idx = 0
+
+    def next(self) -> float:
+        if self._idx >= len(self._buf):
+            self._buf = self._rng.standard_normal(self._batch).tolist()
+            self._idx = 0
+        eps = self._buf[self._idx]
+        self._idx += 1
+        return eps
+
+
+# draws for the scalar Stock.simulate_day path
+_EPS = _GaussBuffer(_RNG)
+
+# simulation step: one day
+DT = 1.0
+
+# days of price history kept per stock
+HISTORY_CAPACITY = 10000
+
+# Optional: with numba installed, large simulations run through a fused,
+# parallel kernel instead of materializing NumPy temporaries.
+# stocks x days from which simulate_days uses it (the first call pays the JIT)
+NUMBA_MIN_CELLS = 1_000_000
+_gbm_kernel = None  # built on first use; False when numba is not installed
+
+
+def _numba_gbm_kernel():
+    """Return the compiled GBM kernel, or None without numba (imported lazily)."""
+    global _gbm_kernel
+    if _gbm_kernel is None:
+        try:
+            from numba import njit, prange
+        except ImportError:
+            _gbm_kernel = False
+            return None
+
+        # cache=True keeps the compiled machine code on disk (__pycache__), so
+        # only the first large simulation ever pays the JIT, not every process
+        @njit(parallel=True, fastmath=True, cache=True)
+        def kernel(price0, drift, diffusion, out_path):
+            # out_path[stock, day]: one running log-price per stock, no temporaries
+            n_stocks, days = out_path.shape
+            for s in prange(n_stocks):
+                log_p = np.log(price0[s])
+                for d in range(days):
+                    log_p += drift[s] + diffusion[s] * np.random.standard_normal()
+                    out_path[s, d] = np.exp(log_p)
+
+        _gbm_kernel = kernel
+    return _gbm_kernel or None
 
 
 class Stock:
@@ -12,28 +76,109 @@ class Stock:
     to simulate daily prices.
     """
 
+    # bumped whenever any stock's mu/sigma changes; Market keys its cached
+    # GBM arrays on it
+    _gbm_epoch: int = 0
+
     def __init__(self, symbol: str, price: float, mu: float = 0.0005, sigma: float = 0.02):
-        self.symbol: str = symbol.upper()
+        # interned: the same object keys Market.stocks and portfolio holdings
+        self.symbol: str = sys.intern(symbol.upper())
         self.price: float = float(price)
-        self.mu: float = float(mu)
-        self.sigma: float = float(sigma)
-        # Each entry: (date, price)
-        self.history: Deque[Tuple[datetime.date, float]] = deque(maxlen=10000)
+        self._mu: float = float(mu)
+        self._sigma: float = float(sigma)
+        self._update_gbm_constants()
+        # Price history as a ring buffer of two parallel arrays (date ordinal,
+        # price); _head is the next write slot, _count the number of entries.
+        self._hist_dord = np.empty(HISTORY_CAPACITY, dtype=np.int32)
+        self._hist_price = np.empty(HISTORY_CAPACITY, dtype=np.float64)
+        self._head: int = 0
+        self._count: int = 0
+
+    @property
+    def mu(self) -> float:
+        return self._mu
+
+    @mu.setter
+    def mu(self, value: float) -> None:
+        self._mu = float(value)
+        self._update_gbm_constants()
+
+    @property
+    def sigma(self) -> float:
+        return self._sigma
+
+    @sigma.setter
+    def sigma(self, value: float) -> None:
+        self._sigma = float(value)
+        self._update_gbm_constants()
+
+    def _update_gbm_constants(self) -> None:
+        """Precompute the per-day (dt = 1) GBM drift and diffusion coefficients."""
+        self._drift_c: float = self._mu - 0.5 * self._sigma * self._sigma
+        self._diff_c: float = self._sigma * math.sqrt(DT)
+        Stock._gbm_epoch += 1
 
     def record(self, date: datetime.date) -> None:
         """Record current price with the given date."""
-        self.history.append((date, self.price))
+        head = self._head
+        self._hist_dord[head] = date.toordinal()
+        self._hist_price[head] = self.price
+        self._head = (head + 1) % HISTORY_CAPACITY
+        self._count = min(self._count + 1, HISTORY_CAPACITY)
+
+    def record_many(self, date_ords: np.ndarray, prices: np.ndarray) -> None:
+        """Bulk-record aligned arrays of date ordinals and prices (oldest first)."""
+        n = len(prices)
+        if n >= HISTORY_CAPACITY:
+            # only the newest HISTORY_CAPACITY entries survive
+            self._hist_dord[:] = date_ords[-HISTORY_CAPACITY:]
+            self._hist_price[:] = prices[-HISTORY_CAPACITY:]
+            self._head = 0
+            self._count = HISTORY_CAPACITY
+            return
+        # at most two contiguous copies: up to the end of the buffer, then the
+        # wrapped remainder from the start
+        head = self._head
+        first = min(n, HISTORY_CAPACITY - head)
+        np.copyto(self._hist_dord[head:head + first], date_ords[:first])
+        np.copyto(self._hist_price[head:head + first], prices[:first])
+        if first < n:
+            np.copyto(self._hist_dord[:n - first], date_ords[first:])
+            np.copyto(self._hist_price[:n - first], prices[first:])
+        self._head = (head + n) % HISTORY_CAPACITY
+        self._count = min(self._count + n, HISTORY_CAPACITY)
+
+    def history_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return recorded history oldest-first as (date ordinals, prices) arrays.
+        These are views into the ring buffer until it wraps; do not mutate.
+        """
+        count = self._count
+        if count < HISTORY_CAPACITY:
+            return self._hist_dord[:count], self._hist_price[:count]
+        head = self._head
+        return (
+            np.concatenate((self._hist_dord[head:], self._hist_dord[:head])),
+            np.concatenate((self._hist_price[head:], self._hist_price[:head])),
+        )
+
+    @property
+    def history(self) -> List[Tuple[datetime.date, float]]:
+        """Recorded history as a list of (date, price) tuples, oldest first."""
+        return list(zip(*self.history_columns()))
+
+    def history_columns(self) -> Tuple[Tuple[datetime.date, ...], Tuple[float, ...]]:
+        """Return recorded history as two aligned columns: (dates, prices)."""
+        date_ords, prices = self.history_arrays()
+        fromordinal = datetime.date.fromordinal
+        return tuple(map(fromordinal, date_ords.tolist())), tuple(prices.tolist())
 
     def simulate_day(self) -> float:
         """
         Simulate one trading day of price movement using GBM.
         Returns the new price.
         """
-        dt = 1.0  # one day
-        eps = random.gauss(0, 1)
-        drift = (self.mu - 0.5 * self.sigma * self.sigma) * dt
-        diffusion = self.sigma * math.sqrt(dt) * eps
-        self.price *= math.exp(drift + diffusion)
+        self.price *= math.exp(self._drift_c + self._diff_c * _EPS.next())
         return self.price
 
 
@@ -46,30 +191,107 @@ class Market:
         self.stocks: Dict[str, Stock] = {}
         # Use today's date if none provided
         self.date: datetime.date = start_date or datetime.date.today()
+        # bumped whenever the stock set or prices change; keys callers' caches
+        self.version: int = 0
+        # (symbols, prices) columns cached by price_vector(); reset on change
+        self._price_vector: Optional[Tuple[Tuple[str, ...], np.ndarray]] = None
+        # symbols in sorted order, cached until the next add_stock
+        self._sorted_symbols: Optional[Tuple[str, ...]] = None
+        # (Stock._gbm_epoch, stocks, drift, diffusion) for simulate_days; reset
+        # by add_stock and stale once any stock's mu/sigma is changed
+        self._gbm_params: Optional[Tuple[int, list, np.ndarray, np.ndarray]] = None
 
     def add_stock(self, stock: Stock) -> None:
         """Add a stock to the market and record its initial price."""
-        key = stock.symbol.upper()
-        self.stocks[key] = stock
+        # Stock.__init__ already uppercased the symbol
+        self.stocks[stock.symbol] = stock
         stock.record(self.date)
+        self.version += 1
+        self._price_vector = None
+        self._sorted_symbols = None
+        self._gbm_params = None
+
+    def sorted_symbols(self) -> Tuple[str, ...]:
+        """Return all symbols in sorted order (re-sorted only after add_stock)."""
+        if self._sorted_symbols is None:
+            self._sorted_symbols = tuple(sorted(self.stocks))
+        return self._sorted_symbols
 
     def list_prices(self) -> Dict[str, float]:
         """Return current prices of all stocks sorted by symbol."""
-        return {symbol: self.stocks[symbol].price for symbol in sorted(self.stocks)}
+        stocks = self.stocks
+        return {symbol: stocks[symbol].price for symbol in self.sorted_symbols()}
+
+    def prices_for(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """Return {symbol: price} for the given symbols, skipping unknown ones."""
+        stocks = self.stocks
+        return {s: stocks[s].price for s in symbols if s in stocks}
+
+    def price_vector(self) -> Tuple[Tuple[str, ...], np.ndarray]:
+        """
+        Return current prices as aligned columns: (symbols, float64 array),
+        sorted by symbol. Cached until the next add_stock/simulate_days.
+        """
+        if self._price_vector is None:
+            symbols = self.sorted_symbols()
+            stocks = self.stocks
+            prices = np.fromiter(
+                (stocks[s].price for s in symbols), dtype=np.float64, count=len(symbols)
+            )
+            self._price_vector = (symbols, prices)
+        return self._price_vector
+
+    def _gbm_arrays(self) -> Tuple[list, np.ndarray, np.ndarray]:
+        """
+        Return (stocks, drift array, diffusion array) from each stock's
+        precomputed GBM constants, rebuilt only after add_stock or a mu/sigma
+        change.
+        """
+        cached = self._gbm_params
+        if cached is None or cached[0] != Stock._gbm_epoch:
+            stocks = list(self.stocks.values())
+            drift = np.array([s._drift_c for s in stocks], dtype=np.float64)
+            diffusion = np.array([s._diff_c for s in stocks], dtype=np.float64)
+            cached = self._gbm_params = (Stock._gbm_epoch, stocks, drift, diffusion)
+        return cached[1], cached[2], cached[3]
 
     def simulate_days(self, days: int = 1) -> None:
         """
         Simulate the market forward by the given number of days.
+        All daily GBM steps are drawn at once with NumPy: log-returns of shape
+        (days, n_stocks) are cumulatively summed into each stock's price path.
+        Very large runs use the fused numba kernel when numba is installed.
         """
         days = int(days)
         if days <= 0:
             return
 
-        for _ in range(days):
-            self.date += datetime.timedelta(days=1)
-            for stock in self.stocks.values():
-                stock.simulate_day()
-                stock.record(self.date)
+        stocks, drift, diffusion = self._gbm_arrays()
+        # all simulated dates as ordinals; self.date moves once, to the last one
+        base_ord = self.date.toordinal()
+        self.date = datetime.date.fromordinal(base_ord + days)
+        n = len(stocks)
+        if n:
+            price0 = np.fromiter((s.price for s in stocks), dtype=np.float64, count=n)
+            kernel = _numba_gbm_kernel() if n * days >= NUMBA_MIN_CELLS else None
+            if kernel is not None:
+                # paths[stock] is that stock's path, contiguous per stock
+                paths = np.empty((n, days), dtype=np.float64)
+                kernel(price0, drift, diffusion, paths)
+            else:
+                eps = _RNG.standard_normal((days, n))
+                # drift + diffusion per step, as in Stock.simulate_day;
+                # accumulate in log space and exponentiate once
+                incr = drift + diffusion * eps
+                log_path = np.cumsum(incr, axis=0)
+                log_path += np.log(price0)
+                paths = np.exp(log_path).T
+            date_ords = np.arange(base_ord + 1, base_ord + days + 1, dtype=np.int32)
+            for stock, path in zip(stocks, paths):
+                stock.record_many(date_ords, path)
+                stock.price = float(path[-1])
+        self.version += 1
+        self._price_vector = None
 
 
 def make_default_market(start_date: Optional[datetime.date] = None) -> Market:
@@ -1,76 +1,631 @@
 # trading.py
+import datetime
+import functools
+import io
 import json
-from collections import defaultdict
+import mmap
+import os
+import sys
+import tempfile
+import threading
+import time
+from array import array
 from pathlib import Path
-from typing import Dict, Any, Optional, List
-import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib json module
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # snapshots stay JSON without msgpack
+    msgpack = None
+
+# JSON codec (trades.jsonl, portfolio.json): orjson when installed, else stdlib json
+# (same output). _dumps_line returns one newline-terminated trades.jsonl line.
+if orjson is not None:
+    _loads = orjson.loads
+    # orjson parses straight from a memoryview (e.g. over an mmap)
+    _loads_view = orjson.loads
+
+    def _dumps_line(data: Dict[str, Any]) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+
+    def _dumps(data: Dict[str, Any]) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+else:
+    _loads = json.loads
+
+    def _loads_view(view: memoryview) -> Any:
+        return json.loads(bytes(view))
+
+    def _dumps(data: Dict[str, Any]) -> bytes:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+
+    def _dumps_line(data: Dict[str, Any]) -> bytes:
+        return (json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+if msgpack is not None:
+    def _dump_snapshot(data: Dict[str, Any]) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def _load_snapshot(raw: bytes) -> Dict[str, Any]:
+        return msgpack.unpackb(raw, raw=False)
+else:
+    _dump_snapshot = _dumps
+    _load_snapshot = _loads
 
 DATA_PATH = Path("data")
-PORTFOLIO_FILE = DATA_PATH / "portfolio.json"
+PORTFOLIO_JSON_FILE = DATA_PATH / "portfolio.json"
+# the snapshot: compact binary portfolio.msgpack when msgpack is installed
+# (migrated once from portfolio.json), else portfolio.json
+PORTFOLIO_FILE = (
+    DATA_PATH / "portfolio.msgpack" if msgpack is not None else PORTFOLIO_JSON_FILE
+)
+# append-only trade log, one JSON object per line, next to the snapshot; it is
+# also the journal: buy/sell append (and fsync) their trade line right away
+TRADES_FILE = DATA_PATH / "trades.jsonl"
+# buy/sell rewrite the portfolio snapshot once every FLUSH_EVERY trades;
+# flush() writes the rest, and load() replays journaled trades it is missing
+FLUSH_EVERY = 32
+# ...or sooner, on the first trade more than FLUSH_INTERVAL seconds after the last save
+FLUSH_INTERVAL = 10.0
+# serializes writes to trades.jsonl and the snapshot across threads (web workers)
+_PERSIST_LOCK = threading.Lock()
+# mkstemp creates files as 0600; temp files renamed over the data files get
+# the mode the replaced file (or a plain open()) would have instead
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _write_replace(path: Path, chunks: Iterable[bytes]) -> int:
+    """
+    Write chunks to a temp file next to path, fsync it and rename it over
+    path, so a crash leaves either the old file or the new one, never a
+    truncated one. Returns the number of bytes written.
+    """
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    try:
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        if hasattr(os, "fchmod"):  # not on Windows before 3.13
+            os.fchmod(fd, mode)
+        with os.fdopen(fd, "wb") as f:
+            f.writelines(chunks)
+            f.flush()
+            # the data must be on disk before the rename makes it the file
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+# trade dates repeat (every trade on a simulated day shares market.date), so
+# their ISO strings are formatted once and reused
+_iso_date = functools.lru_cache(maxsize=64)(datetime.date.isoformat)
+
+
+# one-byte trade type codes: TradeLog.types is a bytearray of these, and
+# trades.jsonl stores them as "B"/"S"
+BUY_CODE = ord("B")
+SELL_CODE = ord("S")
+# code -> the name shown by the API, the CLI and exports
+TYPE_NAMES = {BUY_CODE: "BUY", SELL_CODE: "SELL"}
+# "type" values accepted from disk (older files spell the name out)
+_TYPE_CODES = {"B": BUY_CODE, "BUY": BUY_CODE, "S": SELL_CODE, "SELL": SELL_CODE}
+
+
+def _replay_loop(cash, held, basis, types, sym_ids, qtys, prices):
+    """
+    Apply trades to cash and per-symbol arrays (held qty, cost basis) in
+    place, with the same checks and average-cost rule as buy/sell.
+    Returns (cash, number of trades applied); stops at the first trade that
+    lacks cash or shares. Plain Python, or compiled by _replay_kernel().
+    """
+    for i in range(len(types)):
+        s = sym_ids[i]
+        qty = qtys[i]
+        price = prices[i]
+        if types[i] == BUY_CODE:
+            cost = price * qty
+            if cost > cash + 1e-9:
+                return cash, i
+            cash -= cost
+            held[s] += qty
+            basis[s] += cost
+        else:
+            owned = held[s]
+            if qty > owned:
+                return cash, i
+            cash += price * qty
+            held[s] = owned - qty
+            basis[s] = basis[s] * (owned - qty) / owned
+    return cash, len(types)
+
+
+# Optional: with numba installed, replay_trades runs _replay_loop compiled
+_replay_compiled = None  # built on first use; False when numba is not installed
+
+
+def _replay_kernel():
+    """Return _replay_loop compiled with numba, or the Python version without it."""
+    global _replay_compiled
+    if _replay_compiled is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _replay_compiled = False
+        else:
+            # cache=True keeps the machine code on disk, as for the GBM kernel
+            _replay_compiled = njit(cache=True)(_replay_loop)
+    return _replay_compiled or _replay_loop
+
+
+class Trade:
+    """One trade as a lightweight record (a row of a TradeLog)."""
+
+    __slots__ = ("date", "type", "symbol", "qty", "price")
+
+    def __init__(self, date: str, type: int, symbol: str, qty: int, price: float):
+        self.date = date
+        self.type = type  # BUY_CODE or SELL_CODE
+        self.symbol = symbol
+        self.qty = qty
+        self.price = price
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The trade in the API dict shape ("type" spelled out)."""
+        return {
+            "date": self.date,
+            "type": TYPE_NAMES[self.type],
+            "symbol": self.symbol,
+            "qty": self.qty,
+            "price": self.price,
+        }
+
+
+class TradeLog:
+    """
+    Trade history stored column-wise: one list or typed array per field
+    instead of a dict per trade. Row i across the columns is one trade.
+    Only well-formed BUY/SELL trades with qty > 0 and price >= 0 are kept.
+    """
+
+    __slots__ = ("dates", "types", "symbols", "qtys", "prices")
+
+    def __init__(self):
+        self.dates: List[str] = []
+        self.types = bytearray()
+        self.symbols: List[str] = []
+        self.qtys = array("q")
+        self.prices = array("d")
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def __getitem__(self, i: int) -> Trade:
+        return Trade(self.dates[i], self.types[i], self.symbols[i], self.qtys[i], self.prices[i])
+
+    def rows(self, start: int = 0) -> Iterator[Trade]:
+        """Yield trades from index start on as Trade records."""
+        return map(
+            Trade,
+            self.dates[start:],
+            self.types[start:],
+            self.symbols[start:],
+            self.qtys[start:],
+            self.prices[start:],
+        )
+
+    def append(self, date: str, kind: int, symbol: str, qty: int, price: float) -> None:
+        """Append one already-validated trade (kind is BUY_CODE or SELL_CODE)."""
+        self.dates.append(date)
+        self.types.append(kind)
+        self.symbols.append(symbol)
+        self.qtys.append(qty)
+        self.prices.append(price)
+
+    def append_dict(self, trade: Dict[str, Any]) -> bool:
+        """Normalize and append a trade dict read from disk; False if it is malformed."""
+        try:
+            kind = _TYPE_CODES.get(str(trade.get("type", "")).upper())
+            symbol = sys.intern(str(trade["symbol"]).upper())
+            qty = int(trade["qty"])
+            price = float(trade["price"])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return False
+        if kind is None or qty <= 0 or not price >= 0:
+            return False
+        self.append(str(trade.get("date", "")), kind, symbol, qty, price)
+        return True
+
+    @classmethod
+    def from_dicts(cls, trades: Iterable[Dict[str, Any]]) -> "TradeLog":
+        log = cls()
+        for t in trades:
+            log.append_dict(t)
+        return log
+
+    def records(self, start: int = 0, codes: bool = False) -> List[Dict[str, Any]]:
+        """
+        Return trades from index start on as dicts (the API shape). With
+        codes=True "type" is the one-letter code, as written to trades.jsonl.
+        """
+        names = {BUY_CODE: "B", SELL_CODE: "S"} if codes else TYPE_NAMES
+        return [
+            {"date": d, "type": names[k], "symbol": s, "qty": q, "price": p}
+            for d, k, s, q, p in zip(
+                self.dates[start:],
+                self.types[start:],
+                self.symbols[start:],
+                self.qtys[start:],
+                self.prices[start:],
+            )
+        ]
+
+
+def _read_trades() -> Tuple[TradeLog, bool]:
+    """
+    Parse data/trades.jsonl, skipping blank or unparsable (e.g. torn) lines.
+    Returns (log, whether the file ends with a newline). The file is
+    memory-mapped and each line parsed from a view of the mapping, so a long
+    history is never copied into one bytes object first.
+    """
+    log = TradeLog()
+    with TRADES_FILE.open("rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return log, False  # an empty file cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            ends_with_newline = mm[size - 1] == 0x0A
+            with memoryview(mm) as view:
+                pos = 0
+                while pos < size:
+                    end = mm.find(b"\n", pos)
+                    if end < 0:
+                        end = size
+                    if end > pos:
+                        with view[pos:end] as line:
+                            try:
+                                log.append_dict(_loads_view(line))
+                            except ValueError:
+                                pass
+                    pos = end + 1
+    return log, ends_with_newline
+
+
+def _replay_cost_basis(trades: TradeLog, holdings: Dict[str, int]) -> Dict[str, float]:
+    """Average-cost basis of the current holdings, rebuilt from the trade history."""
+    basis: Dict[str, float] = {}
+    qty: Dict[str, int] = {}
+    for kind, sym, n, price in zip(trades.types, trades.symbols, trades.qtys, trades.prices):
+        held = qty.get(sym, 0)
+        if kind == BUY_CODE:
+            basis[sym] = basis.get(sym, 0.0) + n * price
+            qty[sym] = held + n
+        elif held > 0:
+            remaining = max(held - n, 0)
+            basis[sym] = basis.get(sym, 0.0) * remaining / held
+            qty[sym] = remaining
+    return {sym: basis[sym] for sym in holdings if sym in basis}
 
 
 class Portfolio:
     """
     Simple portfolio class.
     - cash: float
-    - holdings: dict symbol -> qty (ints)
-    - trade_history: list of trade dicts:
+    - holdings: dict symbol -> qty (positive ints)
+    - cost_basis: dict symbol -> total cost of the shares still held
+    - trade_log: TradeLog, the trade history as columns
+    - trade_history: the same trades as a list of dicts (built on access):
         {
           "date": "YYYY-MM-DD",
-          "type": "BUY" | "SELL",
+          "type": "BUY" | "SELL",  (stored as one-byte codes)
           "symbol": "ABC",
           "qty": int,
           "price": float
         }
+    Symbols are uppercase and interned throughout: callers normalize them
+    once at input (CLI parser, web handlers) and load() normalizes what it
+    reads from disk.
     """
 
+    # fixed attribute set: no per-instance __dict__
+    __slots__ = (
+        "cash",
+        "holdings",
+        "cost_basis",
+        "_trade_log",
+        "_journal_size",
+        "_unflushed",
+        "_last_flush",
+        "_trades_saved",
+        "_holdings_version",
+        "_holding_vectors",
+        "_net_worth_memo",
+        "_trade_totals_cache",
+    )
+
+    # set once DATA_PATH is known to exist, so trades skip the mkdir syscall
+    _data_dir_ensured = False
+
+    @classmethod
+    def _ensure_data_dir(cls) -> None:
+        """Create DATA_PATH on first use in this process."""
+        if not cls._data_dir_ensured:
+            DATA_PATH.mkdir(parents=True, exist_ok=True)
+            Portfolio._data_dir_ensured = True
+
     def __init__(self, cash: float = 10000.0):
         self.cash: float = float(cash)
-        self.holdings: Dict[str, int] = defaultdict(int)
-        self.trade_history: List[Dict[str, Any]] = []
+        # symbol -> qty; symbols sold down to zero are removed, so every
+        # entry is a positive position
+        self.holdings: Dict[str, int] = {}
+        # kept up to date by buy/sell (average cost), so P&L never rescans trades
+        self.cost_basis: Dict[str, float] = {}
+        # None until first accessed when load() found nothing to replay
+        self._trade_log: Optional[TradeLog] = TradeLog()
+        # size of trades.jsonl after our last append, recorded in the snapshot
+        self._journal_size: int = 0
+        # trades applied in memory since the last save()
+        self._unflushed: int = 0
+        # time.monotonic() of the last save(), for the FLUSH_INTERVAL trigger
+        self._last_flush: float = time.monotonic()
+        # how many trade_log entries are already in trades.jsonl
+        self._trades_saved: int = 0
+        # bumped on every trade; keys the cached holdings vectors and net_worth memo
+        self._holdings_version: int = 0
+        # (holdings version, market symbols, index array, qty array)
+        self._holding_vectors: Optional[tuple] = None
+        # ((holdings version, cash, market version), market, value)
+        self._net_worth_memo: Optional[tuple] = None
+        # (trade count, total buys, total sells), filled in by trade_totals()
+        self._trade_totals_cache: Optional[tuple] = None
 
     # --- persistence ---
     @classmethod
     def load(cls) -> "Portfolio":
         """
-        Load portfolio from data/portfolio.json.
+        Load portfolio from the PORTFOLIO_FILE snapshot and its trades from
+        data/trades.jsonl; trades are only parsed up front when some must be
+        replayed, otherwise on first access to trade_log. Older files that
+        still carry the trade history inline are read as-is; the next save()
+        moves it to trades.jsonl.
+        With msgpack installed, an existing portfolio.json is read once and
+        re-saved as portfolio.msgpack.
         If file does not exist, create a default one with 10,000 cash.
         """
-        DATA_PATH.mkdir(parents=True, exist_ok=True)
+        cls._ensure_data_dir()
 
-        if not PORTFOLIO_FILE.exists():
+        migrate = False
+        if PORTFOLIO_FILE.exists():
+            data = _load_snapshot(PORTFOLIO_FILE.read_bytes())
+        elif PORTFOLIO_FILE != PORTFOLIO_JSON_FILE and PORTFOLIO_JSON_FILE.exists():
+            data = _loads(PORTFOLIO_JSON_FILE.read_bytes())
+            migrate = True
+        else:
             p = cls()
             p.save()
             return p
 
-        with PORTFOLIO_FILE.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-
         p = cls(cash=data.get("cash", 10000.0))
 
         holdings = data.get("holdings", {}) or {}
-        # normalize keys to uppercase and ensure ints
+        # normalize keys to uppercase and ensure positive ints
         for sym, qty in holdings.items():
             try:
-                p.holdings[sym.upper()] = int(qty)
+                qty = int(qty)
             except Exception:
                 # skip invalid quantities
                 continue
+            if qty > 0:
+                p.holdings[sys.intern(sym.upper())] = qty
+
+        try:
+            journal_size = TRADES_FILE.stat().st_size
+        except FileNotFoundError:
+            journal_size = None
+        applied = data.get("trades_applied")
+        basis = data.get("cost_basis")
 
-        # accept either "trade_history" or "trades" for compatibility
-        p.trade_history = data.get("trade_history", []) or data.get("trades", []) or []
+        if (
+            journal_size is not None
+            and journal_size == data.get("trades_bytes")
+            and isinstance(applied, int)
+            and isinstance(basis, dict)
+        ):
+            # trades.jsonl is exactly as the snapshot left it: nothing to
+            # replay, so its trades are parsed only when first needed
+            p._trade_log = None
+            p._trades_saved = applied
+            p._journal_size = journal_size
+        elif journal_size is not None:
+            p._trade_log, complete = _read_trades()
+            # after a torn last line (crash mid-append) the next save rewrites the log
+            p._trades_saved = len(p._trade_log) if complete else 0
+            p._journal_size = journal_size
+        else:
+            # accept either "trade_history" or "trades" for compatibility
+            p._trade_log = TradeLog.from_dicts(
+                data.get("trade_history", []) or data.get("trades", []) or []
+            )
+
+        if isinstance(basis, dict):
+            p.cost_basis = {
+                sys.intern(sym.upper()): float(cost)
+                for sym, cost in basis.items()
+                if sym.upper() in p.holdings
+            }
+        else:
+            # files written before cost_basis existed: rebuild it once from the trades
+            p.cost_basis = _replay_cost_basis(p.trade_log, p.holdings)
+
+        # trades journaled after the snapshot was written (e.g. the process
+        # died before its next flush) are replayed on top of it; snapshots
+        # without the marker predate the journal and already include every trade
+        log = p._trade_log
+        if log is not None and isinstance(applied, int) and 0 <= applied < len(log):
+            for t in log.rows(applied):
+                p._replay_trade(t.type, t.symbol, t.qty, t.price)
+            # the next flush writes a snapshot that includes them
+            p._unflushed = len(log) - applied
+        if migrate:
+            p.save()
         return p
 
-    def save(self) -> None:
-        """Persist the portfolio to data/portfolio.json."""
-        DATA_PATH.mkdir(parents=True, exist_ok=True)
-        data = {
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Return the serializable state written to the snapshot file.
+        holdings and cost_basis are the live (plain) dicts, not copies:
+        serialize the result right away rather than keeping it.
+        """
+        log = self._trade_log
+        return {
             "cash": self.cash,
-            "holdings": dict(self.holdings),
-            "trade_history": self.trade_history,
+            "holdings": self.holdings,
+            "cost_basis": self.cost_basis,
+            # how many trades.jsonl entries cash/holdings already reflect, and
+            # the journal's size when they were written (see load())
+            "trades_applied": self._trades_saved if log is None else len(log),
+            "trades_bytes": self._journal_size,
         }
-        with PORTFOLIO_FILE.open("w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    @property
+    def trade_log(self) -> TradeLog:
+        """
+        The trade history as a TradeLog, read from trades.jsonl on first access.
+        Trades another process journaled since load() are replayed on top of
+        cash/holdings, as load() does, so the two never disagree.
+        """
+        if self._trade_log is None:
+            log, complete = _read_trades()
+            applied = self._trades_saved
+            if len(log) > applied:
+                for t in log.rows(applied):
+                    self._replay_trade(t.type, t.symbol, t.qty, t.price)
+                self._holdings_version += 1
+                # the next flush writes a snapshot that includes them
+                self._unflushed += len(log) - applied
+                self._trades_saved = len(log)
+                self._journal_size = TRADES_FILE.stat().st_size
+            if not complete or len(log) != self._trades_saved:
+                # torn or truncated under us: rewrite it from memory next save
+                self._trades_saved = 0
+            self._trade_log = log
+        return self._trade_log
+
+    @property
+    def trade_history(self) -> List[Dict[str, Any]]:
+        """All trades as a fresh list of dicts, oldest first."""
+        return self.trade_log.records()
+
+    def trade_totals(self) -> Tuple[float, float]:
+        """
+        Return (total bought, total sold) in cash over all trades, summed with
+        numpy straight from the trade log columns. The log is append-only, so
+        the result is cached keyed by the trade count.
+        """
+        log = self.trade_log
+        n = len(log)
+        cached = self._trade_totals_cache
+        if cached is not None and cached[0] == n:
+            return cached[1], cached[2]
+
+        # np.array / bytes() copy, so the log's buffers are free to grow again afterwards
+        amounts = np.array(log.qtys, dtype=np.float64) * np.array(log.prices, dtype=np.float64)
+        is_buy = np.frombuffer(bytes(log.types), dtype=np.uint8) == BUY_CODE
+        total_buys = float(amounts[is_buy].sum())
+        total_sells = float(amounts[~is_buy].sum())
+        self._trade_totals_cache = (n, total_buys, total_sells)
+        return total_buys, total_sells
+
+    def save(self) -> None:
+        """
+        Persist the portfolio: trades not yet on disk are appended to
+        data/trades.jsonl, then cash and holdings go to PORTFOLIO_FILE.
+        The snapshot is written to a temp file, fsynced, and renamed over the
+        target (_write_replace), so a crash or power loss never leaves a
+        truncated or zero-length file behind. Each save uses its own temp
+        file and holds _PERSIST_LOCK, so concurrent saves cannot interleave.
+        """
+        self._ensure_data_dir()
+        with _PERSIST_LOCK:
+            self._append_journal()
+            _write_replace(PORTFOLIO_FILE, (_dump_snapshot(self.to_dict()),))
+            self._unflushed = 0
+            self._last_flush = time.monotonic()
+
+    def _append_journal(self) -> None:
+        """
+        Append trades not yet in data/trades.jsonl to it and fsync, so each
+        trade costs one small append instead of a full portfolio rewrite.
+        The file is opened per call rather than held open, so /api/reset can
+        rename it away at any time. Callers hold _PERSIST_LOCK.
+        """
+        log = self._trade_log
+        if log is None or (self._trades_saved and self._trades_saved == len(log)):
+            return  # not loaded since load() means nothing new either
+        new_trades = log.records(self._trades_saved, codes=True)
+        # streamed line by line: a migrated history is never joined into one buffer
+        lines = map(_dumps_line, new_trades)
+        if self._trades_saved:
+            with TRADES_FILE.open("ab") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+                self._journal_size = f.tell()
+        else:
+            # a portfolio that never wrote the log (fresh, migrated, or after a
+            # torn line) starts it over; trades.jsonl is the only copy of the
+            # history, so it is replaced whole rather than truncated in place
+            self._journal_size = _write_replace(TRADES_FILE, lines)
+        self._trades_saved = len(log)
+
+    def export_json(self, path: Optional[Path] = None) -> Path:
+        """
+        Write the snapshot as indented JSON for human inspection
+        (default data/portfolio_export.json) and return its path.
+        """
+        path = Path(path) if path is not None else DATA_PATH / "portfolio_export.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(_dumps(self.to_dict()))
+        return path
+
+    def flush(self) -> None:
+        """Save the portfolio if any trades are not on disk yet."""
+        if self._unflushed:
+            self.save()
+
+    def _trade_done(self, persist: bool, count: int = 1) -> None:
+        """
+        Count count trades; when persisting, journal them now and rewrite the
+        snapshot once FLUSH_EVERY trades are pending or FLUSH_INTERVAL
+        seconds have passed since the last one, so bursts coalesce.
+        """
+        self._holdings_version += 1
+        self._unflushed += count
+        if persist:
+            if (
+                self._unflushed >= FLUSH_EVERY
+                or time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+            ):
+                self.save()
+            else:
+                self._ensure_data_dir()
+                with _PERSIST_LOCK:
+                    self._append_journal()
 
     # --- trading ops ---
     def buy(
@@ -79,15 +634,19 @@ class Portfolio:
         price: float,
         qty: int,
         date: Optional[Any] = None,
+        persist: bool = True,
     ) -> None:
         """
-        Buy qty shares of symbol at price.
+        Buy qty shares of symbol (any case) at price.
         Raises ValueError on invalid input or insufficient cash.
+        The trade is journaled at once; the snapshot is rewritten every
+        FLUSH_EVERY trades, after FLUSH_INTERVAL seconds, or on flush().
+        Pass persist=False to leave saving entirely to the caller.
         """
         if symbol is None:
             raise ValueError("Symbol required")
-
-        symbol = symbol.upper()
+        # one cheap pass; interned so holdings share the market's key objects
+        symbol = sys.intern(symbol.upper())
 
         try:
             qty = int(qty)
@@ -97,25 +656,7 @@ class Portfolio:
         if qty <= 0:
             raise ValueError("Quantity must be > 0")
 
-        price = float(price)
-        cost = price * qty
-
-        if cost > self.cash + 1e-9:
-            raise ValueError("Not enough cash")
-
-        self.cash -= cost
-        self.holdings[symbol] = int(self.holdings.get(symbol, 0)) + qty
-
-        self.trade_history.append(
-            {
-                "date": self._format_date(date),
-                "type": "BUY",
-                "symbol": symbol,
-                "qty": qty,
-                "price": price,
-            }
-        )
-        self.save()
+        self._buy_fast(symbol, float(price), qty, self._format_date(date), persist)
 
     def sell(
         self,
@@ -123,15 +664,19 @@ class Portfolio:
         price: float,
         qty: int,
         date: Optional[Any] = None,
+        persist: bool = True,
     ) -> None:
         """
-        Sell qty shares of symbol at price.
+        Sell qty shares of symbol (any case) at price.
         Raises ValueError on invalid input or insufficient shares.
+        The trade is journaled at once; the snapshot is rewritten every
+        FLUSH_EVERY trades, after FLUSH_INTERVAL seconds, or on flush().
+        Pass persist=False to leave saving entirely to the caller.
         """
         if symbol is None:
             raise ValueError("Symbol required")
-
-        symbol = symbol.upper()
+        # one cheap pass; interned so holdings share the market's key objects
+        symbol = sys.intern(symbol.upper())
 
         try:
             qty = int(qty)
@@ -141,75 +686,219 @@ class Portfolio:
         if qty <= 0:
             raise ValueError("Quantity must be > 0")
 
-        owned = int(self.holdings.get(symbol, 0))
-        if qty > owned:
+        self._sell_fast(symbol, float(price), qty, self._format_date(date), persist)
+
+    # Unchecked entry points for batch callers (backtests) that normalize
+    # their input once up front: symbol uppercase/interned, price a float,
+    # qty a positive int, date_iso a "YYYY-MM-DD" string. Only the cash /
+    # share checks remain.
+    def _buy_fast(
+        self, symbol: str, price: float, qty: int, date_iso: str, persist: bool = True
+    ) -> None:
+        log = self.trade_log  # first access may replay journaled trades: check after it
+        if price * qty > self.cash + 1e-9:
+            raise ValueError("Not enough cash")
+        self._apply_buy(symbol, price, qty)
+        log.append(date_iso, BUY_CODE, symbol, qty, price)
+        self._trade_done(persist)
+
+    def _sell_fast(
+        self, symbol: str, price: float, qty: int, date_iso: str, persist: bool = True
+    ) -> None:
+        log = self.trade_log
+        if qty > self.holdings.get(symbol, 0):
             raise ValueError("Not enough shares to sell")
+        self._apply_sell(symbol, price, qty)
+        log.append(date_iso, SELL_CODE, symbol, qty, price)
+        self._trade_done(persist)
 
-        price = float(price)
-        revenue = price * qty
-        self.cash += revenue
+    def replay_trades(
+        self,
+        symbols: Sequence[str],
+        sym_ids: np.ndarray,
+        types: np.ndarray,
+        qtys: np.ndarray,
+        prices: np.ndarray,
+        dates: Sequence[str],
+        persist: bool = True,
+    ) -> None:
+        """
+        Apply a batch of trades given as aligned arrays, for backtests.
+        symbols is the symbol table (uppercase); sym_ids indexes into it,
+        types holds BUY_CODE/SELL_CODE, qtys positive ints, prices floats and
+        dates "YYYY-MM-DD" strings. The arithmetic runs in one loop over the
+        arrays (numba-compiled when installed) and the results are written
+        back to cash/holdings/cost_basis once.
+        Raises ValueError up front for misaligned or out-of-range arrays, and
+        at the first trade lacking cash or shares; the trades before that one
+        stay applied.
+        """
+        symbols = [sys.intern(s) for s in symbols]
+        sym_ids = np.ascontiguousarray(sym_ids, dtype=np.int64)
+        types = np.ascontiguousarray(types, dtype=np.uint8)
+        qtys = np.ascontiguousarray(qtys, dtype=np.int64)
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+        # the compiled loop does no bounds checking, so reject bad input here
+        n_trades = len(types)
+        lengths = {len(sym_ids), len(qtys), len(prices), len(dates)}
+        if lengths != {n_trades}:
+            raise ValueError("trade arrays must all have the same length")
+        if n_trades:
+            if sym_ids.min() < 0 or sym_ids.max() >= len(symbols):
+                raise ValueError("sym_ids must index into symbols")
+            if not np.all((types == BUY_CODE) | (types == SELL_CODE)):
+                raise ValueError("types must be BUY_CODE or SELL_CODE")
+            if qtys.min() <= 0:
+                raise ValueError("qtys must be > 0")
+        log = self.trade_log  # may replay journaled trades; do it before reading holdings
+        held = np.array([self.holdings.get(s, 0) for s in symbols], dtype=np.int64)
+        basis = np.array([self.cost_basis.get(s, 0.0) for s in symbols], dtype=np.float64)
+
+        cash, n = _replay_kernel()(
+            float(self.cash), held, basis, types, sym_ids, qtys, prices
+        )
+
+        if n:
+            self.cash = float(cash)
+            for i, sym in enumerate(symbols):
+                q = int(held[i])
+                if q > 0:
+                    self.holdings[sym] = q
+                    if sym in self.cost_basis or basis[i]:
+                        self.cost_basis[sym] = float(basis[i])
+                else:
+                    self.holdings.pop(sym, None)
+                    self.cost_basis.pop(sym, None)
+            log.dates.extend(dates[:n])
+            log.types.extend(types[:n].tobytes())
+            log.symbols.extend([symbols[i] for i in sym_ids[:n].tolist()])
+            log.qtys.frombytes(qtys[:n].tobytes())
+            log.prices.frombytes(prices[:n].tobytes())
+            self._trade_done(persist, n)
+        if n < n_trades:
+            kind = "cash" if types[n] == BUY_CODE else "shares to sell"
+            raise ValueError(f"Not enough {kind} (trade {n})")
+
+    def _apply_buy(self, symbol: str, price: float, qty: int) -> None:
+        """Move cash into a position; the caller has validated the trade."""
+        cost = price * qty
+        self.cash -= cost
+        self.holdings[symbol] = self.holdings.get(symbol, 0) + qty
+        self.cost_basis[symbol] = self.cost_basis.get(symbol, 0.0) + cost
+
+    def _apply_sell(self, symbol: str, price: float, qty: int) -> None:
+        """Move a position (at most what is held) into cash."""
+        owned = self.holdings.get(symbol, 0)
+        qty = min(qty, owned)
+        if qty <= 0:
+            return
+        self.cash += price * qty
 
         new_qty = owned - qty
         if new_qty <= 0:
             # remove symbol entirely if zero or negative
-            if symbol in self.holdings:
-                del self.holdings[symbol]
+            del self.holdings[symbol]
+            self.cost_basis.pop(symbol, None)
         else:
             self.holdings[symbol] = new_qty
+            # shares leave at average cost
+            if symbol in self.cost_basis:
+                self.cost_basis[symbol] *= new_qty / owned
 
-        self.trade_history.append(
-            {
-                "date": self._format_date(date),
-                "type": "SELL",
-                "symbol": symbol,
-                "qty": qty,
-                "price": price,
-            }
-        )
-        self.save()
+    def _replay_trade(self, kind: int, symbol: str, qty: int, price: float) -> None:
+        """Re-apply a journaled (already normalized) trade to cash/holdings."""
+        if kind == BUY_CODE:
+            self._apply_buy(symbol, price, qty)
+        else:
+            self._apply_sell(symbol, price, qty)
 
     def _format_date(self, date_val: Optional[Any]) -> str:
         """Return YYYY-MM-DD string for date_val or today's date if None."""
         if date_val is None:
-            return datetime.date.today().isoformat()
+            return _iso_date(datetime.date.today())
         if isinstance(date_val, datetime.datetime):
-            return date_val.date().isoformat()
+            return _iso_date(date_val.date())
         if isinstance(date_val, datetime.date):
-            return date_val.isoformat()
+            return _iso_date(date_val)
         # fallback if some other type is passed
         return str(date_val)
 
     # --- helpers ---
+    def _holdings_vectors(self, symbols: tuple) -> tuple:
+        """
+        Return (index array into symbols, qty array) for the held symbols that
+        are in the market. Rebuilt only after a trade or a market symbol change.
+        """
+        cached = self._holding_vectors
+        if cached is not None and cached[0] == self._holdings_version and cached[1] is symbols:
+            return cached[2], cached[3]
+        position = {sym: i for i, sym in enumerate(symbols)}
+        idx, qty = [], []
+        for sym, q in self.holdings.items():
+            i = position.get(sym)
+            if i is not None:  # skip unknown/removed symbol
+                idx.append(i)
+                qty.append(q)
+        idx_arr = np.array(idx, dtype=np.intp)
+        qty_arr = np.array(qty, dtype=np.float64)
+        self._holding_vectors = (self._holdings_version, symbols, idx_arr, qty_arr)
+        return idx_arr, qty_arr
+
     def net_worth(self, market) -> float:
         """
         Compute net worth given a market.
         Skip symbols missing from the market instead of raising.
+        Holdings are priced with one dot product against market.price_vector();
+        markets without it are priced per holding from market.stocks.
         """
-        value = float(self.cash or 0.0)
-        for sym, qty in self.holdings.items():
-            if qty <= 0:
-                continue
-            # ensure lookup uses uppercase keys
-            stock = getattr(market, "stocks", {}).get(sym.upper())
-            if stock is None:
-                # skip unknown/removed symbol
-                continue
-            value += float(stock.price) * int(qty)
+        # markets with a version counter (bumped whenever prices change) get
+        # a 1-slot memo, so repeated calls between trades/simulated days are O(1)
+        version = getattr(market, "version", None)
+        key = (self._holdings_version, self.cash, version)
+        memo = self._net_worth_memo
+        if version is not None and memo is not None and memo[0] == key and memo[1] is market:
+            return memo[2]
+
+        if hasattr(market, "price_vector"):
+            symbols, price_arr = market.price_vector()
+            idx, qty = self._holdings_vectors(symbols)
+            value = float(self.cash or 0.0) + float(np.dot(price_arr[idx], qty))
+        else:
+            stocks = getattr(market, "stocks", None) or {}
+            value = float(self.cash or 0.0)
+            for sym, qty in self.holdings.items():
+                stock = stocks.get(sym)
+                if stock is not None:
+                    value += float(stock.price) * qty
+        if version is not None:
+            self._net_worth_memo = (key, market, value)
         return value
 
     def summary(self, market) -> str:
         """Return a human-readable summary for CLI usage."""
-        lines = []
-        lines.append(f"Cash: {self.cash:.2f}")
-        lines.append(f"Net worth: {self.net_worth(market):.2f}")
-        lines.append("Holdings:")
+        # one price lookup per holding, shared by the net worth and the rows;
+        # markets without prices_for are read from market.stocks, as in net_worth
+        if hasattr(market, "prices_for"):
+            prices = market.prices_for(self.holdings)
+        else:
+            stocks = getattr(market, "stocks", None) or {}
+            prices = {s: stocks[s].price for s in self.holdings if s in stocks}
+        cost_basis = self.cost_basis
+        net_worth = float(self.cash or 0.0)
+        # rows are streamed into one buffer (each starting with its newline)
+        # instead of collected in a list and joined
+        rows = io.StringIO()
+        write = rows.write
         for sym, qty in self.holdings.items():
-            if qty <= 0:
-                continue
-            stock = getattr(market, "stocks", {}).get(sym.upper())
-            if stock is None:
-                lines.append(f"  {sym}: {qty} shares @ UNKNOWN (market missing)")
+            price = prices.get(sym)
+            if price is None:
+                write(f"\n  {sym}: {qty} shares @ UNKNOWN (market missing)")
                 continue
-            price = float(stock.price)
-            lines.append(f"  {sym}: {qty} shares @ {price:.2f} -> {qty * price:.2f}")
-        return "\n".join(lines)
+            price = float(price)
+            value = qty * price
+            net_worth += value
+            write(f"\n  {sym}: {qty} shares @ {price:.2f} -> {value:.2f}")
+            basis = cost_basis.get(sym)
+            if basis is not None:
+                write(f" (P&L {value - basis:+.2f})")
+        return f"Cash: {self.cash:.2f}\nNet worth: {net_worth:.2f}\nHoldings:{rows.getvalue()}"
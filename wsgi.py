@@ -0,0 +1,18 @@
+# wsgi.py
+"""
+WSGI entrypoint for running the API under gunicorn with gevent workers.
+
+gevent must patch sockets/threading before Flask and the app are imported, so
+the monkey-patch happens at the very top of this module.
+
+Run with:
+    gunicorn -k gevent -w 1 --worker-connections 1000 -b 127.0.0.1:5001 wsgi:app
+"""
+
+from gevent import monkey
+
+monkey.patch_all()
+
+from app import app  # noqa: E402
+
+__all__ = ["app"]